@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks of spade_pubsub against an in-memory pyjabber server.
+
+Run them with `make bench` or::
+
+    python benchmarks/run.py --output bench_results.json
+
+The results are written as JSON so that two runs can be compared.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+from loguru import logger
+from pyjabber.server import Parameters, Server
+from spade.agent import Agent
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import spade_pubsub  # noqa: E402
+from spade_pubsub import PubSubMixin  # noqa: E402
+
+PUBSUB_JID = "pubsub.localhost"
+AGENT_DOMAIN = "localhost"
+PAYLOAD = "x" * 256
+
+
+class BenchAgent(PubSubMixin, Agent):
+    pass
+
+
+def percentiles(samples: List[float]) -> dict:
+    """
+    Summarize a list of durations, in milliseconds.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pick(0.5),
+        "p90_ms": pick(0.9),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+async def start_agent(name: str) -> BenchAgent:
+    agent = BenchAgent(f"{name}@{AGENT_DOMAIN}", "password")
+    await agent.start(auto_register=True)
+    return agent
+
+
+class Collector:
+    """
+    Counts the notifications received by an agent.
+
+    pyjabber does not include the item ids in the notifications, so items are
+    counted rather than matched.
+    """
+
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.received = 0
+        self.last = 0.0
+        self.done = asyncio.Event()
+        self.next = asyncio.Event()
+
+    def __call__(self, msg):
+        self.last = time.perf_counter()
+        self.received += len(msg["pubsub_event"]["items"].iterables)
+        self.next.set()
+        if self.received >= self.expected:
+            self.done.set()
+
+
+async def bench_publish_throughput(publisher, node: str, items: int) -> dict:
+    pubsub = publisher.pubsub
+    await pubsub.create(PUBSUB_JID, node)
+
+    start = time.perf_counter()
+    for i in range(items):
+        await pubsub.publish(PUBSUB_JID, node, PAYLOAD, item_id=f"seq-{i}")
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await pubsub.publish_many(
+        PUBSUB_JID,
+        node,
+        [PAYLOAD] * items,
+        max_in_flight=16,
+    )
+    concurrent = time.perf_counter() - start
+
+    await pubsub.delete(PUBSUB_JID, node)
+    return {
+        "items": items,
+        "sequential_items_per_s": items / sequential,
+        "concurrent_items_per_s": items / concurrent,
+    }
+
+
+async def bench_notification_latency(publisher, subscriber, node: str, items: int):
+    await publisher.pubsub.create(PUBSUB_JID, node)
+    await subscriber.pubsub.subscribe(PUBSUB_JID, node)
+    collector = Collector(items)
+    subscriber.pubsub.on_item_published(node, collector)
+
+    samples = []
+    for i in range(items):
+        collector.next.clear()
+        sent = time.perf_counter()
+        await publisher.pubsub.publish(PUBSUB_JID, node, PAYLOAD, item_id=f"lat-{i}")
+        await asyncio.wait_for(collector.next.wait(), timeout=10)
+        samples.append(collector.last - sent)
+
+    subscriber.pubsub.off_item_published(node, collector)
+    await subscriber.pubsub.unsubscribe(PUBSUB_JID, node)
+    await publisher.pubsub.delete(PUBSUB_JID, node)
+    return percentiles(samples)
+
+
+async def bench_fan_out(publisher, node: str, subscribers: int, items: int) -> dict:
+    agents = [await start_agent(f"bench-sub-{i}") for i in range(subscribers)]
+    await publisher.pubsub.create(PUBSUB_JID, node)
+    collectors = []
+    for agent in agents:
+        await agent.pubsub.subscribe(PUBSUB_JID, node)
+        collector = Collector(items)
+        agent.pubsub.on_item_published(node, collector)
+        collectors.append(collector)
+
+    start = time.perf_counter()
+    await publisher.pubsub.publish_many(PUBSUB_JID, node, [PAYLOAD] * items)
+    await asyncio.wait_for(
+        asyncio.gather(*(c.done.wait() for c in collectors)), timeout=60
+    )
+    elapsed = time.perf_counter() - start
+
+    await publisher.pubsub.delete(PUBSUB_JID, node)
+    for agent in agents:
+        await agent.stop()
+    return {
+        "subscribers": subscribers,
+        "items": items,
+        "seconds": elapsed,
+        "notifications_per_s": subscribers * items / elapsed,
+    }
+
+
+async def bench_get_items(publisher, node: str, size: int, repeat: int) -> dict:
+    await publisher.pubsub.create(PUBSUB_JID, node)
+    await publisher.pubsub.publish_many(PUBSUB_JID, node, [PAYLOAD] * size)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await publisher.pubsub.get_items(PUBSUB_JID, node)
+        samples.append(time.perf_counter() - start)
+    await publisher.pubsub.delete(PUBSUB_JID, node)
+    return {"node_size": size, **percentiles(samples)}
+
+
+async def bench_startup(repeat: int) -> dict:
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        agent = await start_agent(f"bench-startup-{i}")
+        samples.append(time.perf_counter() - start)
+        await agent.stop()
+    return percentiles(samples)
+
+
+async def run(args) -> dict:
+    server = Server(Parameters(database_in_memory=True))
+    server_task = asyncio.create_task(server.start())
+    await asyncio.sleep(0.5)
+
+    results = {
+        "spade_pubsub": spade_pubsub.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "parameters": vars(args),
+    }
+    publisher = await start_agent("bench-publisher")
+    subscriber = await start_agent("bench-subscriber")
+    try:
+        results["startup"] = await bench_startup(args.repeat)
+        results["publish_throughput"] = await bench_publish_throughput(
+            publisher, "bench-throughput", args.items
+        )
+        results["notification_latency"] = await bench_notification_latency(
+            publisher, subscriber, "bench-latency", args.items
+        )
+        results["fan_out"] = [
+            await bench_fan_out(publisher, f"bench-fan-out-{n}", n, args.items)
+            for n in args.subscribers
+        ]
+        results["get_items"] = [
+            await bench_get_items(publisher, f"bench-items-{n}", n, args.repeat)
+            for n in args.node_sizes
+        ]
+    finally:
+        await subscriber.stop()
+        await publisher.stop()
+        server_task.cancel()
+        try:
+            await server_task
+        except asyncio.CancelledError:
+            pass
+    return results
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """
+    Return the timings and rates of some results keyed by their path.
+    """
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, list):
+            value = {str(i): v for i, v in enumerate(value)}
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif key.endswith(("_ms", "_per_s", "seconds")):
+            values[prefix + key] = value
+    return values
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Return the measures of `results` that are more than `tolerance` (a fraction)
+    worse than in `baseline`.
+    """
+    regressions = []
+    current = flatten(results)
+    for key, before in flatten(baseline).items():
+        after = current.get(key)
+        if after is None or not before:
+            continue
+        change = (after - before) / before
+        if key.endswith("_per_s"):
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{key}: {before:.3f} -> {after:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--subscribers", type=int, nargs="+", default=[1, 5, 10], metavar="N"
+    )
+    parser.add_argument(
+        "--node-sizes", type=int, nargs="+", default=[10, 100, 500], metavar="N"
+    )
+    parser.add_argument(
+        "--baseline", help="Results of a previous run to check for regressions"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Fraction by which a measure may be worse than in the baseline",
+    )
+    args = parser.parse_args()
+
+    logger.remove()
+    results = asyncio.run(run(args))
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression in {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,10 @@ setup_requirements = ['pytest-runner', ]
 
 test_requirements = ['pytest>=3', ]
 
+extras_requirements = {
+    'msgpack': ['msgpack>=1.0'],
+}
+
 setup(
     author="Javi Palanca",
     author_email='jpalanca@dsic.upv.es',
@@ -40,6 +44,7 @@ setup(
     ],
     description="SPADE Plugin for PubSub support.",
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
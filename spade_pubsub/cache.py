@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    A size bounded LRU mapping whose entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be greater than 0")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the value stored for `key`, or `default` if it is missing or expired.
+        """
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            return default
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Store `value` for `key`, evicting the least recently used entry if full.
+        """
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def discard_if(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Remove every entry whose key matches `predicate`.
+        """
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+_MISSING = object()
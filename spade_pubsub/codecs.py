@@ -0,0 +1,158 @@
+import base64
+import json
+import zlib
+from typing import Any, NamedTuple, Optional
+from xml.etree.ElementTree import Element
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+PAYLOAD_NAMESPACE = "spade.pubsub"
+COMPRESSED_ENCODING = "deflate"
+
+
+class PubSubItem(NamedTuple):
+    """
+    An item received from a node, with its payload already decoded.
+    """
+
+    service: str
+    node: str
+    id: Optional[str]
+    payload: Any
+
+
+class Codec:
+    """
+    Converts values to and from the `<payload xmlns="spade.pubsub">` element
+    of the published items.
+
+    Subclasses set a unique `name`, which is stored in the `codec` attribute
+    of the payload, and implement `encode_text` and `decode_text`.
+    """
+
+    name: str = ""
+
+    def encode(self, value: Any) -> Element:
+        payload = make_payload_element()
+        if self.name:
+            payload.set("codec", self.name)
+        payload.text = self.encode_text(value)
+        return payload
+
+    def decode(self, payload: Element) -> Any:
+        return self.decode_text(payload.text or "")
+
+    def encode_text(self, value: Any) -> str:
+        raise NotImplementedError
+
+    def decode_text(self, text: str) -> Any:
+        raise NotImplementedError
+
+
+class TextCodec(Codec):
+    """
+    Publishes strings as they are. It is the default codec.
+    """
+
+    name = ""
+
+    def encode_text(self, value: Any) -> str:
+        return value
+
+    def decode_text(self, text: str) -> str:
+        return text
+
+
+class JSONCodec(Codec):
+    name = "json"
+
+    def encode_text(self, value: Any) -> str:
+        return json.dumps(value, separators=(",", ":"))
+
+    def decode_text(self, text: str) -> Any:
+        return json.loads(text)
+
+
+class MsgPackCodec(Codec):
+    """
+    Packs values with msgpack and publishes them encoded in base64.
+    Requires the `msgpack` package (``pip install spade_pubsub[msgpack]``).
+    """
+
+    name = "msgpack"
+
+    def encode_text(self, value: Any) -> str:
+        return base64.b64encode(self._msgpack().packb(value)).decode("ascii")
+
+    def decode_text(self, text: str) -> Any:
+        return self._msgpack().unpackb(base64.b64decode(text))
+
+    @staticmethod
+    def _msgpack():
+        if msgpack is None:
+            raise ImportError(
+                "The msgpack codec requires the msgpack package, "
+                "install it with: pip install spade_pubsub[msgpack]"
+            )
+        return msgpack
+
+
+class XMLCodec(Codec):
+    """
+    Publishes an XML Element as the child of the payload.
+    """
+
+    name = "xml"
+
+    def encode(self, value: Element) -> Element:
+        payload = make_payload_element()
+        payload.set("codec", self.name)
+        payload.append(value)
+        return payload
+
+    def decode(self, payload: Element) -> Optional[Element]:
+        return next(iter(payload), None)
+
+
+def make_payload_element() -> Element:
+    return Element("payload", attrib={"xmlns": PAYLOAD_NAMESPACE})
+
+
+def default_codecs() -> dict:
+    return {
+        codec.name: codec
+        for codec in (TextCodec(), JSONCodec(), XMLCodec(), MsgPackCodec())
+    }
+
+
+def compress_payload(payload: Element, threshold: int, level: int = 6) -> Element:
+    """
+    Compress the text of a payload with zlib if it is at least `threshold`
+    bytes long, replacing it with its base64 encoding and marking the payload
+    with an `encoding="deflate"` attribute. Payloads with child elements are
+    left untouched.
+    """
+    if not payload.text or len(payload) or payload.get("encoding"):
+        return payload
+    raw = payload.text.encode("utf-8")
+    if len(raw) < threshold:
+        return payload
+    compressed = base64.b64encode(zlib.compress(raw, level))
+    if len(compressed) < len(raw):
+        payload.text = compressed.decode("ascii")
+        payload.set("encoding", COMPRESSED_ENCODING)
+    return payload
+
+
+def inflate_payload(payload: Optional[Element]) -> Optional[Element]:
+    """
+    Undo `compress_payload` in place. Other payloads are returned as they are.
+    """
+    if payload is not None and payload.get("encoding") == COMPRESSED_ENCODING:
+        raw = zlib.decompress(base64.b64decode(payload.text or ""))
+        payload.text = raw.decode("utf-8")
+        del payload.attrib["encoding"]
+    return payload
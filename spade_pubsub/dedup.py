@@ -0,0 +1,41 @@
+from typing import Optional
+
+from .cache import TTLCache
+
+
+class SeenItems:
+    """
+    Remembers the ids of the last `maxsize` items received, from any node, for
+    `ttl` seconds (None keeps them until they are evicted), and counts the
+    repeated items that were dropped. The nodes share a single least recently
+    used cache, so a busy node may evict the ids of a quieter one.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self._seen = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def add(self, service: Optional[str], node: Optional[str], item_id: str) -> bool:
+        """
+        Record an item, returning False if it had already been seen, in which
+        case it is counted as dropped.
+
+        Items without id are never considered repeated.
+        """
+        if not item_id:
+            return True
+        key = (service, node, item_id)
+        if key in self._seen:
+            self.dropped += 1
+            return False
+        self._seen.set(key, True)
+        return True
+
+    def discard(self, service: Optional[str], node: Optional[str], item_id: str):
+        """
+        Forget an item, so that it is accepted again if it is published again.
+        """
+        self._seen.pop((service, node, item_id))
@@ -0,0 +1,261 @@
+import asyncio
+import inspect
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+RouteKey = Tuple[Optional[str], Optional[str]]
+
+OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+
+class EventRouter:
+    """
+    Maps (service, node) pairs to the callbacks interested in them.
+
+    A `None` service or node is a wildcard, so every notification is matched
+    against at most four entries whatever the number of registered routes.
+    """
+
+    def __init__(self):
+        self._routes: Dict[RouteKey, List[Callable]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._routes)
+
+    def add(self, service: Optional[str], node: Optional[str], callback: Callable):
+        self._routes.setdefault((service, node), []).append(callback)
+
+    def remove(
+        self,
+        service: Optional[str],
+        node: Optional[str],
+        callback: Optional[Callable] = None,
+    ):
+        """
+        Remove `callback` from a route, or the whole route if `callback` is None.
+        """
+        key = (service, node)
+        if callback is None:
+            self._routes.pop(key, None)
+            return
+        callbacks = self._routes.get(key, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            self._routes.pop(key, None)
+
+    def match(self, service: str, node: str) -> List[Callable]:
+        """
+        Return the callbacks of the exact route followed by the wildcard ones.
+        """
+        routes = self._routes
+        if not routes:
+            return []
+        callbacks = []
+        for key in ((service, node), (None, node), (service, None), (None, None)):
+            callbacks.extend(routes.get(key, ()))
+        return callbacks
+
+
+def run_callback(callback: Callable, *args) -> None:
+    """
+    Call `callback`, scheduling the coroutine it returns, if any.
+    """
+    try:
+        result = callback(*args)
+    except Exception:
+        logger.exception(f"Error in pubsub callback {callback}")
+        return
+    if inspect.isawaitable(result):
+        asyncio.ensure_future(_await_callback(callback, result))
+
+
+async def _await_callback(callback: Callable, result: Any) -> None:
+    try:
+        await result
+    except Exception:
+        logger.exception(f"Error in pubsub callback {callback}")
+
+
+class Backlog:
+    """
+    Notifications held back by the ``"block"`` overflow policy until there is
+    room for them.
+
+    Notification handlers cannot wait without stalling the XMPP stream, so
+    "block" cannot push back on the service: at most `maxsize` notifications
+    are held, and the ones arriving after them are refused. A warning is
+    logged when the backlog starts refusing notifications.
+    """
+
+    def __init__(self, maxsize: int, name: str):
+        self.maxsize = maxsize
+        self.name = name
+        self._items: Deque[Any] = deque()
+        self._overflowing = False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def hold(self, item: Any) -> bool:
+        """
+        Hold `item`, returning False if the backlog is full.
+        """
+        if len(self._items) < self.maxsize:
+            self._items.append(item)
+            return True
+        if not self._overflowing:
+            self._overflowing = True
+            logger.warning(
+                f"Dropping notifications of {self.name}: "
+                f"{self.maxsize} are already held back"
+            )
+        return False
+
+    def release(self) -> Any:
+        """
+        Return the oldest held item.
+        """
+        self._overflowing = False
+        return self._items.popleft()
+
+
+class CallbackExecutor:
+    """
+    Runs notification callbacks outside of the XMPP event path.
+
+    Notifications with the same key (service, node) are handled one after the
+    other in arrival order, while up to `max_concurrency` keys are handled at
+    the same time. At most `max_pending` notifications wait to be handled;
+    when that limit is reached the `overflow` policy applies:
+
+    * ``"block"``: the notification is held back in a Backlog of
+      `max_blocked` notifications (`max_pending` by default) until there is
+      room for it, and discarded if the backlog is full.
+    * ``"drop_newest"``: the incoming notification is discarded.
+    * ``"drop_oldest"``: the oldest notification waiting for the same key is
+      discarded (or the incoming one, if there is none).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_pending: int = 1000,
+        overflow: str = "block",
+        run_in_thread: bool = False,
+        max_blocked: Optional[int] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        if max_concurrency < 1 or max_pending < 1:
+            raise ValueError("max_concurrency and max_pending must be greater than 0")
+        self.max_pending = max_pending
+        self.max_blocked = max_pending if max_blocked is None else max_blocked
+        self.overflow = overflow
+        self.run_in_thread = run_in_thread
+        self.dropped = 0
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._queues: Dict[RouteKey, Deque[Tuple[List[Callable], tuple]]] = {}
+        self._pending = 0
+        self._blocked = Backlog(self.max_blocked, "the callback executor")
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def blocked(self) -> int:
+        return len(self._blocked)
+
+    def submit(self, key: RouteKey, callbacks: List[Callable], *args) -> None:
+        """
+        Queue `callbacks` to be called with `args` once the previous
+        notifications with the same `key` have been handled.
+        """
+        if self._pending < self.max_pending and not self._blocked:
+            self._enqueue(key, callbacks, args)
+        elif self.overflow == "block":
+            if not self._blocked.hold((key, callbacks, args)):
+                self.dropped += 1
+        elif self.overflow == "drop_oldest" and self._queues.get(key):
+            self._queues[key].popleft()
+            self._queues[key].append((callbacks, args))
+            self.dropped += 1
+        else:
+            self.dropped += 1
+
+    def _enqueue(self, key, callbacks, args):
+        self._pending += 1
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            asyncio.ensure_future(self._drain(key, queue))
+        queue.append((callbacks, args))
+
+    async def _drain(self, key, queue):
+        while queue:
+            callbacks, args = queue.popleft()
+            self._pending -= 1
+            if self._blocked:
+                self._enqueue(*self._blocked.release())
+            async with self._slots:
+                for callback in callbacks:
+                    await self._run(callback, args)
+        del self._queues[key]
+
+    async def _run(self, callback, args):
+        try:
+            if self.run_in_thread and not inspect.iscoroutinefunction(callback):
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(None, callback, *args)
+            else:
+                result = callback(*args)
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            logger.exception(f"Error in pubsub callback {callback}")
+
+
+class Conflator:
+    """
+    Collapses the notifications of a key that arrive while its callbacks are
+    busy into a single pending one, the latest.
+
+    The callbacks of a key run at most once per drain cycle, with the latest
+    notification received since they last ran. The notifications replaced by
+    a newer one are counted in `conflated`.
+    """
+
+    def __init__(self):
+        self.conflated = 0
+        self._latest: Dict[RouteKey, Tuple[List[Callable], tuple]] = {}
+        self._draining: Set[RouteKey] = set()
+
+    def submit(self, key: RouteKey, callbacks: List[Callable], *args) -> None:
+        if key in self._latest:
+            self.conflated += 1
+        self._latest[key] = (callbacks, args)
+        if key not in self._draining:
+            self._draining.add(key)
+            asyncio.ensure_future(self._drain(key))
+
+    async def _drain(self, key):
+        try:
+            while key in self._latest:
+                callbacks, args = self._latest.pop(key)
+                for callback in callbacks:
+                    await self._run(callback, args)
+        finally:
+            self._draining.discard(key)
+
+    @staticmethod
+    async def _run(callback, args):
+        try:
+            result = callback(*args)
+        except Exception:
+            logger.exception(f"Error in pubsub callback {callback}")
+            return
+        if inspect.isawaitable(result):
+            await _await_callback(callback, result)
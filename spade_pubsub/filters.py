@@ -0,0 +1,79 @@
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Optional
+from xml.etree.ElementTree import Element
+
+from loguru import logger
+
+_MISSING = object()
+
+
+class ItemFilter:
+    """
+    Decides which received items reach the published item callbacks.
+
+    An item is accepted if its payload element has a match for `xpath` (the
+    subset of XPath supported by ElementTree, relative to the payload), if
+    every field of its decoded payload equals the value given in `fields`
+    (or, if the value is callable, makes it return True), and if `predicate`
+    returns True for the decoded payload. Field names may be dotted paths into
+    nested mappings. The checks run in that order and stop at the first
+    failure, so the payload is only decoded if the XPath matched.
+
+    `options` are subscription options (XEP-0060, 6.3) sent when subscribing
+    with the filter, for services that can filter the items themselves.
+    """
+
+    def __init__(
+        self,
+        xpath: Optional[str] = None,
+        fields: Optional[Dict[str, Any]] = None,
+        predicate: Optional[Callable[[Any], bool]] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        if xpath is not None:
+            Element("payload").find(xpath)  # Fail early on invalid paths
+        self.xpath = xpath
+        self.fields = [
+            (tuple(name.split(".")), expected)
+            for name, expected in (fields or {}).items()
+        ]
+        self.predicate = predicate
+        self.options = dict(options or {})
+        self.rejected = 0
+
+    def matches(
+        self, payload: Optional[Element], decode: Callable[[Element], Any]
+    ) -> bool:
+        """
+        Return whether an item with `payload` is accepted, decoding it with
+        `decode` if needed.
+        """
+        try:
+            accepted = self._matches(payload, decode)
+        except Exception as e:
+            logger.debug(f"Could not filter item: {e}")
+            accepted = False
+        if not accepted:
+            self.rejected += 1
+        return accepted
+
+    def _matches(self, payload: Optional[Element], decode: Callable) -> bool:
+        if payload is None:
+            return False
+        if self.xpath is not None and payload.find(self.xpath) is None:
+            return False
+        if not self.fields and self.predicate is None:
+            return True
+        value = decode(payload)
+        for path, expected in self.fields:
+            field = value
+            for name in path:
+                if not isinstance(field, Mapping):
+                    return False
+                field = field.get(name, _MISSING)
+            if callable(expected):
+                if field is _MISSING or not expected(field):
+                    return False
+            elif field != expected:
+                return False
+        return self.predicate is None or bool(self.predicate(value))
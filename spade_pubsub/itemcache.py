@@ -0,0 +1,141 @@
+import copy
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from xml.etree.ElementTree import Element
+
+NodeKey = Tuple[Optional[str], Optional[str]]
+
+
+class ItemCache:
+    """
+    Keeps the last `size` items of each node, updated with the publish, retract
+    and purge notifications sent by the services.
+
+    The items of a node are only `complete` once they have been `load`-ed from
+    the service and while every item of the node fits in the buffer. Each
+    change increases the `version` of the node, so a load that raced with a
+    notification is discarded instead of overwriting the newer items.
+
+    The buffer of a node holds at most its `max_items` (pubsub#max_items), dropping
+    the oldest item as the service does. When it is not known, the node is only
+    trusted to keep as many items as it held when it was loaded, and it stops
+    being complete when it grows beyond them. The payloads are copied in
+    and out, so callers may modify them.
+    """
+
+    def __init__(self, size: int = 20):
+        if size < 1:
+            raise ValueError("size must be greater than 0")
+        self.size = size
+        self._items: Dict[NodeKey, OrderedDict] = {}
+        self._complete: Set[NodeKey] = set()
+        self._versions: Dict[NodeKey, int] = {}
+        self._max_items: Dict[NodeKey, int] = {}
+        self._loaded: Dict[NodeKey, int] = {}
+
+    def version(self, service: Optional[str], node: Optional[str]) -> int:
+        return self._versions.get((service, node), 0)
+
+    def set_max_items(
+        self, service: Optional[str], node: Optional[str], max_items: Optional[int]
+    ):
+        """
+        Set the maximum number of items the service keeps in a node, or None if
+        it is not known.
+        """
+        key = (service, node)
+        if max_items is None:
+            self._max_items.pop(key, None)
+        else:
+            self._max_items[key] = max_items
+
+    def load(
+        self,
+        service: Optional[str],
+        node: Optional[str],
+        items: Iterable[Tuple[str, Element]],
+        version: int,
+    ):
+        """
+        Replace the items of a node with the ones sent by its service, unless the
+        node changed since `version`.
+        """
+        key = (service, node)
+        if version != self.version(*key):
+            return
+        items = list(items)
+        self._items[key] = OrderedDict(
+            (item_id, copy.deepcopy(payload))
+            for item_id, payload in items[-self.size :]
+        )
+        self._loaded[key] = len(items)
+        if len(items) <= self.size:
+            self._complete.add(key)
+        else:
+            self._complete.discard(key)
+
+    def add(
+        self,
+        service: Optional[str],
+        node: Optional[str],
+        item_id: str,
+        payload: Element,
+    ):
+        key = self._touch(service, node)
+        buffer = self._items.setdefault(key, OrderedDict())
+        buffer.pop(item_id, None)
+        buffer[item_id] = copy.deepcopy(payload)
+        max_items = self._max_items.get(key)
+        if max_items is not None:
+            if len(buffer) > max_items:
+                # The service drops its oldest item as well
+                buffer.popitem(last=False)
+        elif len(buffer) > self._loaded.get(key, 0):
+            self._complete.discard(key)
+        if len(buffer) > self.size:
+            buffer.popitem(last=False)
+            self._complete.discard(key)
+
+    def remove(self, service: Optional[str], node: Optional[str], item_id: str):
+        key = self._touch(service, node)
+        self._items.get(key, {}).pop(item_id, None)
+
+    def clear(self, service: Optional[str], node: Optional[str]):
+        """
+        Remove every item of a node, which is then known to be empty.
+        """
+        key = self._touch(service, node)
+        self._items[key] = OrderedDict()
+        self._complete.add(key)
+
+    def invalidate(self, service: Optional[str], node: Optional[str]):
+        """
+        Stop trusting the items of a node until it is loaded again.
+        """
+        self._complete.discard(self._touch(service, node))
+
+    def forget(self, service: Optional[str], node: Optional[str]):
+        key = self._touch(service, node)
+        self._items.pop(key, None)
+        self._complete.discard(key)
+        self._max_items.pop(key, None)
+        self._loaded.pop(key, None)
+
+    def items(
+        self, service: Optional[str], node: Optional[str]
+    ) -> Optional[List[Tuple[str, Element]]]:
+        """
+        Return copies of the items of a node, oldest first, or None if they are
+        not complete.
+        """
+        if (service, node) not in self._complete:
+            return None
+        return [
+            (item_id, copy.deepcopy(payload))
+            for item_id, payload in self._items[(service, node)].items()
+        ]
+
+    def _touch(self, service: Optional[str], node: Optional[str]) -> NodeKey:
+        key = (service, node)
+        self._versions[key] = self._versions.get(key, 0) + 1
+        return key
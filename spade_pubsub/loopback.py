@@ -0,0 +1,64 @@
+import copy
+import weakref
+from typing import Dict, List, Optional, Tuple
+from xml.etree.ElementTree import Element
+
+NodeKey = Tuple[Optional[str], Optional[str]]
+
+
+class LoopbackBus:
+    """
+    Delivers published items to the PubSub components of the same process
+    that are subscribed to the node, without a round trip to the service.
+
+    Components join the bus with `enable_loopback` and are registered for the
+    nodes they subscribe to. The bus only keeps weak references to them, so
+    stopped agents do not need to leave it explicitly.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[NodeKey, weakref.WeakSet] = {}
+
+    def subscribe(self, service: Optional[str], node: Optional[str], component):
+        self._subscribers.setdefault((service, node), weakref.WeakSet()).add(component)
+
+    def unsubscribe(self, service: Optional[str], node: Optional[str], component):
+        subscribers = self._subscribers.get((service, node))
+        if subscribers is not None:
+            subscribers.discard(component)
+            if not subscribers:
+                del self._subscribers[(service, node)]
+
+    def remove(self, component):
+        """
+        Unregister a component from every node.
+        """
+        for key in list(self._subscribers):
+            self.unsubscribe(*key, component)
+
+    def subscribers(self, service: Optional[str], node: Optional[str]) -> List:
+        return list(self._subscribers.get((service, node), ()))
+
+    def deliver(
+        self,
+        service: Optional[str],
+        node: Optional[str],
+        item_id: str,
+        payload: Element,
+    ) -> int:
+        """
+        Hand an item to every local subscriber of a node.
+
+        Each subscriber gets its own copy of the payload, as the handlers
+        may modify it.
+
+        Return:
+            The number of components the item was delivered to.
+        """
+        subscribers = self.subscribers(service, node)
+        for component in subscribers:
+            component._deliver_local(service, node, item_id, copy.deepcopy(payload))
+        return len(subscribers)
+
+
+default_bus = LoopbackBus()
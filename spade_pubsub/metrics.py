@@ -0,0 +1,188 @@
+import asyncio
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+from slixmpp.exceptions import IqError, IqTimeout
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def error_condition(error: BaseException) -> str:
+    """
+    Return the XMPP error condition of an error, or a name describing it.
+    """
+    if isinstance(error, IqError):
+        return error.condition or "undefined-condition"
+    if isinstance(error, IqTimeout):
+        return "timeout"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    return type(error).__name__
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Return the upper bound of the bucket holding the `q` quantile.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": buckets,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """
+    Latency histograms, outcome counters and gauges of the requests sent by
+    a PubSubComponent, and counters of the notifications it receives.
+
+    Outcomes are "ok" or the XMPP error condition of the failure ("timeout"
+    if no answer arrived).
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, per_node=True):
+        self.buckets = tuple(buckets)
+        self.per_node = per_node
+        self.started = time.monotonic()
+        self.latency: Dict[str, Histogram] = {}
+        self.node_latency: Dict[Tuple[str, Optional[str]], Histogram] = {}
+        self.outcomes: Counter = Counter()
+        self.in_flight: Counter = Counter()
+        self.notifications: Counter = Counter()
+        self._exporters: List[Callable[[dict], None]] = []
+        self._export_task: Optional[asyncio.Task] = None
+
+    def start(self, operation: str) -> float:
+        self.in_flight[operation] += 1
+        return time.perf_counter()
+
+    def finish(
+        self,
+        operation: str,
+        target_node: Optional[str],
+        started: float,
+        error: Optional[BaseException] = None,
+    ):
+        elapsed = time.perf_counter() - started
+        self.in_flight[operation] -= 1
+        histogram = self.latency.get(operation)
+        if histogram is None:
+            histogram = self.latency[operation] = Histogram(self.buckets)
+        histogram.observe(elapsed)
+        if self.per_node:
+            key = (operation, target_node)
+            histogram = self.node_latency.get(key)
+            if histogram is None:
+                histogram = self.node_latency[key] = Histogram(self.buckets)
+            histogram.observe(elapsed)
+        outcome = "ok" if error is None else error_condition(error)
+        self.outcomes[(operation, outcome)] += 1
+
+    def notification(self, kind: str, target_node: Optional[str]):
+        self.notifications[(kind, target_node)] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Return the current values as plain dictionaries.
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "uptime": elapsed,
+            "latency": {op: h.snapshot() for op, h in self.latency.items()},
+            "node_latency": {
+                f"{op}:{node}": h.snapshot()
+                for (op, node), h in self.node_latency.items()
+            },
+            "outcomes": {
+                f"{op}:{outcome}": n for (op, outcome), n in self.outcomes.items()
+            },
+            "in_flight": dict(self.in_flight),
+            "notifications": {
+                f"{kind}:{node}": {"count": n, "rate": n / elapsed}
+                for (kind, node), n in self.notifications.items()
+            },
+        }
+
+    def add_exporter(self, exporter: Callable[[dict], None]):
+        """
+        Add a callable that receives a snapshot every time `export` is called.
+        """
+        self._exporters.append(exporter)
+
+    def export(self):
+        if not self._exporters:
+            return
+        snapshot = self.snapshot()
+        for exporter in self._exporters:
+            try:
+                exporter(snapshot)
+            except Exception:
+                logger.exception(f"Error in metrics exporter {exporter}")
+
+    def start_exporting(self, interval: float):
+        """
+        Call `export` every `interval` seconds.
+        """
+        self.stop_exporting()
+        self._export_task = asyncio.ensure_future(self._export_periodically(interval))
+
+    def stop_exporting(self):
+        if self._export_task is not None:
+            self._export_task.cancel()
+            self._export_task = None
+
+    async def _export_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.export()
@@ -0,0 +1,236 @@
+import asyncio
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple
+from xml.etree import ElementTree
+from xml.etree.ElementTree import Element
+
+from loguru import logger
+
+OutboxEntry = Tuple[int, str, str, str, Element]
+
+# Error conditions of a publish request that sending it again will not fix
+PERMANENT_CONDITIONS = (
+    "bad-request",
+    "feature-not-implemented",
+    "forbidden",
+    "item-not-found",
+    "jid-malformed",
+    "not-acceptable",
+    "not-allowed",
+    "not-authorized",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    service TEXT NOT NULL,
+    node TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    payload TEXT NOT NULL
+)
+"""
+
+
+class Outbox:
+    """
+    Publications waiting for the acknowledgement of their service, kept in a
+    sqlite database so that they survive restarts and outages.
+
+    Writes are committed in batches: a commit happens `commit_interval`
+    seconds after the first uncommitted write, or as soon as `max_batch`
+    writes are waiting, and every `add` waiting for it returns once it is on
+    disk. The database is only used from a dedicated thread, so commits do
+    not block the event loop. Entries being sent are `in_flight` and are not
+    returned by `take` until they are removed or released.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        commit_interval: float = 0.01,
+        max_batch: int = 100,
+        synchronous: str = "FULL",
+    ):
+        if max_batch < 1:
+            raise ValueError("max_batch must be greater than 0")
+        self.path = path
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.commits = 0
+        self.in_flight: Set[int] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pubsub-outbox"
+        )
+        self._db: Optional[sqlite3.Connection] = self._executor.submit(
+            self._open, path, synchronous
+        ).result()
+        self._size = self._executor.submit(self._count, self._db).result()
+        self._uncommitted = 0
+        self._committed: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def closed(self) -> bool:
+        return self._db is None
+
+    async def add(self, service: str, node: str, item_id: str, payload: Element) -> int:
+        """
+        Store a publication, returning its entry id once it has been committed.
+        The entry is in flight until it is removed or released.
+        """
+        if self._db is None:
+            raise ValueError("The outbox is closed")
+        entry = await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            self._insert,
+            self._db,
+            service,
+            node,
+            item_id,
+            ElementTree.tostring(payload, encoding="unicode"),
+        )
+        self._size += 1
+        self.in_flight.add(entry)
+        await asyncio.shield(self._schedule_commit())
+        return entry
+
+    def remove(self, entry: int):
+        """
+        Delete an acknowledged publication. The deletion is committed with the next batch.
+        """
+        if entry not in self.in_flight:
+            return
+        self.in_flight.discard(entry)
+        if self._db is not None:
+            self._size -= 1
+            self._executor.submit(self._delete, self._db, entry)
+            self._schedule_commit()
+
+    def release(self, entry: int):
+        """
+        Keep a publication that could not be sent, to be taken again later.
+        """
+        self.in_flight.discard(entry)
+
+    async def take(self) -> List[OutboxEntry]:
+        """
+        Return the stored publications that are not in flight, oldest first,
+        marking them as in flight.
+        """
+        if self._db is None:
+            return []
+        rows = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._select, self._db
+        )
+        entries = [row for row in rows if row[0] not in self.in_flight]
+        self.in_flight.update(entry[0] for entry in entries)
+        return entries
+
+    def flush(self):
+        """
+        Commit the pending writes now.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        committed, self._committed = self._committed, None
+        uncommitted, self._uncommitted = self._uncommitted, 0
+        if committed is None:
+            return
+        if self._db is None or not uncommitted:
+            if not committed.done():
+                committed.set_result(None)
+            return
+        done = asyncio.wrap_future(self._executor.submit(self._commit, self._db))
+        done.add_done_callback(lambda future: self._on_committed(committed, future))
+
+    def close(self):
+        """
+        Commit the pending writes and close the database, waiting for both.
+        """
+        if self._db is None:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        committed, self._committed = self._committed, None
+        db, self._db = self._db, None
+        self._executor.submit(self._close, db, self._uncommitted)
+        self._uncommitted = 0
+        self._executor.shutdown(wait=True)
+        if committed is not None and not committed.done():
+            committed.set_result(None)
+
+    def _schedule_commit(self) -> asyncio.Future:
+        self._uncommitted += 1
+        if self._committed is None:
+            loop = asyncio.get_running_loop()
+            self._committed = loop.create_future()
+            self._timer = loop.call_later(self.commit_interval, self.flush)
+        committed = self._committed
+        if self._uncommitted >= self.max_batch:
+            self.flush()
+        return committed
+
+    @staticmethod
+    def _on_committed(committed: asyncio.Future, future: Future):
+        error = future.exception()
+        if committed.done():
+            return
+        if error is None:
+            committed.set_result(None)
+            return
+        logger.error(f"Could not commit the outbox: {error}")
+        committed.set_exception(error)
+        committed.exception()  # Already logged, raised to the writers waiting
+
+    # The methods below run in the thread of the executor
+
+    @staticmethod
+    def _open(path: str, synchronous: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(f"PRAGMA synchronous={synchronous}")
+        db.execute(_SCHEMA)
+        db.commit()
+        return db
+
+    @staticmethod
+    def _count(db: sqlite3.Connection) -> int:
+        return db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    @staticmethod
+    def _insert(
+        db: sqlite3.Connection, service: str, node: str, item_id: str, payload: str
+    ) -> int:
+        return db.execute(
+            "INSERT INTO outbox (service, node, item_id, payload) VALUES (?, ?, ?, ?)",
+            (service, node, item_id, payload),
+        ).lastrowid
+
+    @staticmethod
+    def _delete(db: sqlite3.Connection, entry: int):
+        db.execute("DELETE FROM outbox WHERE id = ?", (entry,))
+
+    @staticmethod
+    def _select(db: sqlite3.Connection) -> List[OutboxEntry]:
+        return [
+            (entry, service, node, item_id, ElementTree.fromstring(payload))
+            for entry, service, node, item_id, payload in db.execute(
+                "SELECT id, service, node, item_id, payload FROM outbox ORDER BY id"
+            )
+        ]
+
+    def _commit(self, db: sqlite3.Connection):
+        db.commit()
+        self.commits += 1
+
+    def _close(self, db: sqlite3.Connection, uncommitted: int):
+        if uncommitted:
+            db.commit()
+            self.commits += 1
+        db.close()
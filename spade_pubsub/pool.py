@@ -0,0 +1,170 @@
+import asyncio
+import functools
+import itertools
+import zlib
+from typing import Dict, List, Optional
+
+from slixmpp import JID, ClientXMPP
+
+_TLS_SETTINGS = (
+    "ssl_context",
+    "enable_direct_tls",
+    "enable_starttls",
+    "enable_plaintext",
+)
+
+
+class StreamPool:
+    """
+    Extra XMPP streams of the account of a client, used to send requests in
+    parallel instead of serializing them on a single stream.
+
+    Each stream is bound to its own resource and does not send presence, so
+    the notifications of the account are still delivered to the main client.
+    With `node_affinity`, the requests of a node always go through the same
+    stream, which keeps their order; otherwise streams are used in turns.
+
+    Each stream pings the server every `keepalive_interval` seconds and
+    reconnects if it gets no answer. A stream that disconnects for any other
+    reason is connected again while the pool is running, after
+    `reconnect_delay` seconds, doubled after each attempt that does not start
+    a session, up to `max_reconnect_delay`. `clients` only holds the streams
+    that are connected: a stream leaves it when it disconnects and comes back
+    once its session starts again.
+    """
+
+    def __init__(
+        self,
+        client: ClientXMPP,
+        size: int = 4,
+        node_affinity: bool = True,
+        keepalive_interval: float = 60.0,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 60.0,
+    ):
+        if size < 1:
+            raise ValueError("size must be greater than 0")
+        self.size = size
+        self.node_affinity = node_affinity
+        self.keepalive_interval = keepalive_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.clients: List[ClientXMPP] = []
+        self._streams: List[ClientXMPP] = []
+        self._reconnects: Dict[ClientXMPP, asyncio.TimerHandle] = {}
+        self._attempts: Dict[ClientXMPP, int] = {}
+        self._main = client
+        self._turns = itertools.count()
+
+    async def start(self, timeout: float = 30.0):
+        """
+        Connect the streams, waiting until all their sessions have started.
+        """
+        clients = [self._create(index) for index in range(self.size)]
+        try:
+            await asyncio.gather(*(self._connect(c, timeout) for c in clients))
+        except BaseException:
+            for client in clients:
+                client.cancel_connection_attempt()
+            await self._disconnect(clients)
+            raise
+        self._watch(clients)
+
+    async def stop(self):
+        clients, self._streams, self.clients = self._streams, [], []
+        for timer in self._reconnects.values():
+            timer.cancel()
+        self._reconnects.clear()
+        self._attempts.clear()
+        await self._disconnect(clients)
+
+    def client(self, service: Optional[str], node: Optional[str]) -> ClientXMPP:
+        """
+        Return the connected stream to send a request to a node through.
+        """
+        if self.node_affinity:
+            index = zlib.crc32(f"{service}/{node}".encode())
+        else:
+            index = next(self._turns)
+        return self.clients[index % len(self.clients)]
+
+    def _create(self, index: int) -> ClientXMPP:
+        jid = JID(self._main.boundjid.bare)
+        jid.resource = f"{self._main.boundjid.resource or 'spade'}-pubsub-{index}"
+        client = ClientXMPP(jid, self._main.password)
+        for setting in _TLS_SETTINGS:
+            if hasattr(self._main, setting):
+                setattr(client, setting, getattr(self._main, setting))
+        client.register_plugin("xep_0060")
+        client.register_plugin(
+            "xep_0199", {"keepalive": True, "interval": self.keepalive_interval}
+        )
+        return client
+
+    def _watch(self, clients: List[ClientXMPP]):
+        self._streams = clients
+        self.clients = list(clients)
+        for client in clients:
+            client.add_event_handler(
+                "disconnected", functools.partial(self._on_disconnected, client)
+            )
+            client.add_event_handler(
+                "session_start", functools.partial(self._on_session_start, client)
+            )
+
+    def _on_disconnected(self, client: ClientXMPP, _event):
+        if client in self.clients:
+            self.clients.remove(client)
+        if client in self._streams and client not in self._reconnects:
+            attempt = self._attempts.get(client, 0)
+            self._attempts[client] = attempt + 1
+            delay = min(self.reconnect_delay * 2**attempt, self.max_reconnect_delay)
+            self._reconnects[client] = client.loop.call_later(
+                delay, self._reconnect, client
+            )
+
+    def _reconnect(self, client: ClientXMPP):
+        self._reconnects.pop(client, None)
+        # A ping timeout makes slixmpp reconnect the stream by itself
+        if client in self._streams and not (
+            client.is_connecting() or client.is_connected()
+        ):
+            client.connect(*(getattr(self._main, "custom_address", None) or ()))
+
+    def _on_session_start(self, client: ClientXMPP, _event):
+        self._attempts.pop(client, None)
+        if client in self._streams and client not in self.clients:
+            # Keep the order of the streams, so that nodes go back to theirs
+            self.clients = [
+                c for c in self._streams if c in self.clients or c is client
+            ]
+
+    async def _connect(self, client: ClientXMPP, timeout: float):
+        session = asyncio.get_running_loop().create_future()
+
+        def _finish(error: Optional[Exception]):
+            if not session.done():
+                if error is None:
+                    session.set_result(None)
+                else:
+                    session.set_exception(error)
+
+        client.add_event_handler("session_start", lambda _: _finish(None))
+        client.add_event_handler(
+            "failed_all_auth",
+            lambda _: _finish(
+                ConnectionError(f"Could not authenticate {client.boundjid}")
+            ),
+        )
+        client.add_event_handler(
+            "disconnected",
+            lambda _: _finish(ConnectionError(f"Could not connect {client.boundjid}")),
+        )
+        client.connect(*(getattr(self._main, "custom_address", None) or ()))
+        await asyncio.wait_for(session, timeout)
+
+    @staticmethod
+    async def _disconnect(clients: List[ClientXMPP]):
+        await asyncio.gather(
+            *(client.disconnect() for client in clients), return_exceptions=True
+        )
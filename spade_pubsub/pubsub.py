@@ -1,12 +1,41 @@
+import asyncio
+import copy
+import functools
+import inspect
+import uuid
 from loguru import logger
-from typing import Optional, List, Union
+from typing import AsyncIterator, Callable, Iterable, Optional, List, Union
 from xml.etree.ElementTree import Element
 
-from slixmpp import ClientXMPP
-from slixmpp.exceptions import IqError
+from slixmpp import JID, ClientXMPP
+from slixmpp.exceptions import IqError, IqTimeout
 from slixmpp.plugins.xep_0004.stanza.form import Form
+from slixmpp.plugins.xep_0059 import Set
 from slixmpp.plugins.xep_0060 import XEP_0060
-from slixmpp.stanza import Iq
+from slixmpp.plugins.xep_0060.stanza import EventItem, Pubsub
+from slixmpp.stanza import Iq, Message
+from slixmpp.xmlstream import register_stanza_plugin
+
+from .cache import TTLCache
+from .codecs import (
+    Codec,
+    PubSubItem,
+    compress_payload,
+    default_codecs,
+    inflate_payload,
+)
+from .dedup import SeenItems
+from .dispatch import CallbackExecutor, Conflator, EventRouter, run_callback
+from .filters import ItemFilter
+from .itemcache import ItemCache
+from .loopback import LoopbackBus, default_bus
+from .metrics import Metrics
+from .outbox import PERMANENT_CONDITIONS, Outbox
+from .pool import StreamPool
+from .ratelimit import PUSHBACK_CONDITIONS, RateLimiter
+from .retry import PubSubError, RetryPolicy
+from .stream import PubSubStream
+from .subscriptions import SubscriptionRegistry
 
 
 class PubSubMixin:
@@ -21,7 +50,13 @@ class PubSubMixin:
         except AttributeError:
             logger.debug("_hook_plugin_after_connection is undefined")
 
-        self.pubsub = self.PubSubComponent(self.client)
+        component = getattr(self, "pubsub", None)
+        if isinstance(component, self.PubSubComponent):
+            # Connecting again: keep the subscriptions and callbacks known so far
+            component.bind(self.client)
+            asyncio.ensure_future(component._on_reconnect())
+        else:
+            self.pubsub = self.PubSubComponent(self.client)
 
     async def _hook_plugin_before_connection(self, *args, **kwargs):
         """
@@ -33,11 +68,147 @@ class PubSubMixin:
             logger.debug("_hook_plugin_before_connection is undefined")
 
     class PubSubComponent:
-        def __init__(self, client):
+        def __init__(self, client, max_unacked_publishes: int = 100):
+            self._unacked_publishes = asyncio.Semaphore(max_unacked_publishes)
+            self._node_cache: Optional[TTLCache] = None
+            self._subscription_cache = False
+            self._subscription_ttl: Optional[float] = None
+            self._known_nodes: set[tuple[str, str]] = set()
+            self._published_routes = EventRouter()
+            self._retracted_routes = EventRouter()
+            self._executor: Optional[CallbackExecutor] = None
+            self._conflator = Conflator()
+            self._conflated_nodes: set[tuple[Optional[str], str]] = set()
+            self._filters: dict[tuple[Optional[str], str], ItemFilter] = {}
+            self._stream_pool: Optional[StreamPool] = None
+            self._outbox: Optional[Outbox] = None
+            self._codecs: dict[str, Codec] = default_codecs()
+            self._node_codecs: dict[tuple[Optional[str], str], str] = {}
+            self._compression: Optional[tuple[int, int]] = None
+            self._metrics: Optional[Metrics] = None
+            self._retry_policy = RetryPolicy()
+            self._rate_limiter: Optional[RateLimiter] = None
+            self._subscriptions = SubscriptionRegistry()
+            self._loopback: Optional[LoopbackBus] = None
+            self._loopback_delivered: Optional[TTLCache] = None
+            self._item_cache: Optional[ItemCache] = None
+            self._seen_items: Optional[SeenItems] = None
+            self._recovery: Optional[tuple[int, int]] = None
+            self._last_seen: dict[tuple[str, str], str] = {}
+            self.raise_errors = False
+            self.bind(client)
+
+        def bind(self, client):
+            """
+            Use an XMPP client to talk to the services, e.g. the new client of an
+            agent that connected again. The state of the component is kept.
+
+            Args:
+                client (ClientXMPP): The client of the agent.
+            """
             self.client: ClientXMPP = client
             self.client.register_plugin("xep_0060")
             self.pubsub: XEP_0060 = self.client["xep_0060"]  # Pubsub XEP
             self.client.register_plugin("xep_0004")  # Dataforms XEP
+            register_stanza_plugin(Pubsub, Set)  # Result Set Management in pubsub
+            self.client.add_event_handler("session_start", self._on_session_start)
+            self.client.add_event_handler("pubsub_publish", self._on_publish)
+            self.client.add_event_handler("pubsub_retract", self._on_retract)
+            self.client.add_event_handler(
+                "pubsub_subscription", self._on_subscription_changed
+            )
+            self.client.add_event_handler("pubsub_purge", self._on_purge)
+            self.client.add_event_handler("pubsub_delete", self._on_node_changed)
+            self.client.add_event_handler("pubsub_config", self._on_node_changed)
+
+        def enable_node_cache(self, ttl: float = 30.0, maxsize: int = 128):
+            """
+            Keep the results of `get_nodes` in memory.
+
+            Listings are invalidated after `ttl` seconds, when this component creates,
+            deletes or purges a node of the service, or when the service notifies a
+            node deletion or configuration change.
+
+            Args:
+                ttl (float): Seconds a listing is served from memory.
+                maxsize (int): Maximum number of listings kept.
+            """
+            self._node_cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+        def disable_node_cache(self):
+            """
+            Stop caching the results of `get_nodes`.
+            """
+            self._node_cache = None
+
+        def enable_subscription_cache(self, ttl: Optional[float] = 30.0):
+            """
+            Answer `get_node_subscriptions` from the local subscription registry.
+
+            The subscriptions of a node are requested once and then updated with
+            the subscriptions and unsubscriptions of this component and the
+            subscription notifications of the service. Services do not notify the
+            owner of every new subscriber, so the subscribers added by other jids
+            are only seen when the subscriptions are requested again, after `ttl`
+            seconds.
+
+            Args:
+                ttl (float or None): Seconds the subscriptions of a node are served
+                    from memory. None keeps them until `refresh` is used.
+            """
+            self._subscription_cache = True
+            self._subscription_ttl = ttl
+
+        def disable_subscription_cache(self):
+            """
+            Request the subscriptions of a node on every `get_node_subscriptions`.
+            """
+            self._subscription_cache = False
+
+        def _on_session_start(self, _event):
+            # The component is created once the session has started, so this
+            # is a new session of the same client.
+            asyncio.ensure_future(self._on_reconnect())
+
+        async def _on_reconnect(self):
+            try:
+                if self._outbox is not None:
+                    await self.replay_outbox()
+                if self._recovery is not None:
+                    await self.recover(*self._recovery)
+            except Exception:
+                logger.exception("Error restoring the pubsub state after reconnecting")
+
+        def _invalidate_nodes(self, target_jid: str):
+            if self._node_cache is not None:
+                self._node_cache.discard_if(lambda key: key[0] == str(target_jid))
+
+        def _on_subscription_changed(self, msg: Message):
+            subscription = msg["pubsub_event"]["subscription"]
+            key = (msg["from"].bare, subscription["node"])
+            if subscription["subscription"] == "none":
+                self._subscriptions.remove(
+                    *key, subscription["jid"], subscription["subid"] or None
+                )
+            else:
+                self._subscriptions.add(
+                    *key, subscription["jid"], subscription["subid"] or None
+                )
+            self._sync_subscription(*key)
+
+        def _on_node_changed(self, msg: Message):
+            self._invalidate_nodes(msg["from"].bare)
+            if msg["pubsub_event"]["delete"]["node"]:
+                key = (msg["from"].bare, msg["pubsub_event"]["delete"]["node"])
+                self._known_nodes.discard(key)
+                self._subscriptions.forget(*key)
+                self._sync_subscription(*key)
+
+        def _on_purge(self, msg: Message):
+            if self._item_cache is not None:
+                self._item_cache.clear(
+                    msg["from"].bare, msg["pubsub_event"]["purge"]["node"]
+                )
 
         # OWNER USE CASES
         async def create(
@@ -45,6 +216,7 @@ class PubSubMixin:
             target_jid: str,
             target_node: Optional[str] = None,
             config_form: Optional[Form] = None,
+            retry: Optional[RetryPolicy] = None,
         ):
             """
             Create a new node at a service.
@@ -53,27 +225,80 @@ class PubSubMixin:
                 target_jid (str): Address of the PubSub service.
                 target_node (str or None): Name of the PubSub node to create
                 config_form (Slixmpp Form): Dataform to configurate the node to create
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
             """
             try:
-                res = await self.pubsub.create_node(
-                    target_jid, target_node, config=config_form
+                res = await self._call(
+                    "create",
+                    target_node,
+                    self.pubsub.create_node,
+                    target_jid,
+                    target_node,
+                    config=config_form,
+                    retry=retry,
                 )
-                if (
-                    target_node
-                    and res["pubsub"]
-                    and res["pubsub"]["create"]
-                    and res["pubsub"]["create"]["node"]
-                ):
-                    return res["pubsub"]["create"]["node"]
-                else:
-                    return target_node
-            except IqError as e:
-                logger.error(f"Error creating node <{target_node}>: {e}")
+                node = self._created_node(res, target_node)
+                self._known_nodes.add((str(target_jid), node))
+                if self._item_cache is not None and config_form is not None:
+                    self._item_cache.set_max_items(
+                        self._bare(target_jid), node, self._max_items(config_form)
+                    )
+                return node
+            except PubSubError as e:
+                self._fail(e, f"Error creating node <{target_node}>")
+            finally:
+                self._invalidate_nodes(target_jid)
+
+        async def ensure_node(
+            self,
+            target_jid: str,
+            target_node: str,
+            config_form: Optional[Form] = None,
+            retry: Optional[RetryPolicy] = None,
+        ):
+            """
+            Create a node unless it is already known to exist.
+
+            Nodes created by this component, or found to exist because the service
+            answered with a `conflict` error, are remembered so that later calls
+            do not contact the service again.
+
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str): Name of the PubSub node to create
+                config_form (Slixmpp Form): Dataform to configurate the node to create
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+            """
+            key = (str(target_jid), target_node)
+            if key in self._known_nodes:
+                return target_node
+            try:
+                res = await self._call(
+                    "create",
+                    target_node,
+                    self.pubsub.create_node,
+                    target_jid,
+                    target_node,
+                    config=config_form,
+                    retry=retry,
+                )
+                target_node = self._created_node(res, target_node)
+            except PubSubError as e:
+                if e.condition != "conflict":
+                    self._fail(e, f"Error creating node <{target_node}>")
+                    return None
+            finally:
+                self._invalidate_nodes(target_jid)
+            self._known_nodes.add((str(target_jid), target_node))
+            return target_node
 
         async def delete(
             self,
             target_jid: str,
             target_node: Optional[str],
+            retry: Optional[RetryPolicy] = None,
         ):
             """
             Delete an existing node.
@@ -81,24 +306,64 @@ class PubSubMixin:
             Args:
                 target_jid (str): Address of the PubSub service.
                 target_node (str or None): Name of the PubSub node to delete.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
             """
             try:
-                return await self.pubsub.delete_node(target_jid, target_node)
-            except IqError as e:
-                logger.error(f"Error deleting node <{target_node}>: {e}")
+                res = await self._call(
+                    "delete",
+                    target_node,
+                    self.pubsub.delete_node,
+                    target_jid,
+                    target_node,
+                    retry=retry,
+                )
+                self._known_nodes.discard((str(target_jid), target_node))
+                self._subscriptions.forget(self._bare(target_jid), target_node)
+                self._sync_subscription(self._bare(target_jid), target_node)
+                return res
+            except PubSubError as e:
+                self._fail(e, f"Error deleting node <{target_node}>")
+            finally:
+                self._invalidate_nodes(target_jid)
 
         async def get_node_subscriptions(
-            self, target_jid: str, target_node: Optional[str]
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            retry: Optional[RetryPolicy] = None,
+            refresh: bool = False,
         ) -> List[str]:
             """
             Return the subscriptions of other jids with a node.
 
+            The subscriptions are requested from the service, unless the
+            subscription cache is enabled and they were requested less than its
+            `ttl` ago (see `enable_subscription_cache`).
+
             Args:
                 target_jid (str): Address of the PubSub service.
                 target_node (str): Name of the node to query
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+                refresh (bool): Request the subscriptions even if they are cached.
             """
+            service = self._bare(target_jid)
+            if not refresh and self._subscription_cache:
+                subscribers = self._subscriptions.subscribers(
+                    service, target_node, max_age=self._subscription_ttl
+                )
+                if subscribers is not None:
+                    return subscribers
             try:
-                data: Iq = await self.pubsub.get_subscriptions(target_jid, target_node)
+                data: Iq = await self._call(
+                    "get_subscriptions",
+                    target_node,
+                    self.pubsub.get_subscriptions,
+                    target_jid,
+                    target_node,
+                    retry=retry,
+                )
                 if (
                     data["pubsub"]
                     and data["pubsub"]["subscriptions"]
@@ -107,74 +372,353 @@ class PubSubMixin:
                         for i in data["pubsub"]["subscriptions"]
                     )
                 ):
-                    return list(
-                        set(
-                            [
-                                sub["jid"]
-                                for sub in data["pubsub"]["subscriptions"]["substanzas"]
-                            ]
-                        )
-                    )
+                    subscriptions = [
+                        (sub["jid"], sub["subid"])
+                        for sub in data["pubsub"]["subscriptions"]["substanzas"]
+                    ]
                 else:
-                    return []
-            except IqError as e:
-                logger.error(
-                    f"Error retrieving owner subscriptions from node <{target_node}>: {e}"
+                    subscriptions = []
+                self._subscriptions.load(service, target_node, subscriptions)
+                return self._subscriptions.subscribers(service, target_node)
+            except PubSubError as e:
+                self._fail(
+                    e, f"Error retrieving owner subscriptions from node <{target_node}>"
                 )
 
-        async def purge(self, target_jid: str, target_node: Optional[str]):
+        async def purge(
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            retry: Optional[RetryPolicy] = None,
+        ):
             """
             Delete all items from a node.
 
             Args:
                 target_jid (str): JID of the PubSub service
                 target_node (str): Name of the PubSub node
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
             """
             try:
-                return await self.pubsub.purge(target_jid, target_node)
-            except IqError as e:
-                logger.error(f"Error purging node <{target_node}>: {e}")
+                res = await self._call(
+                    "purge",
+                    target_node,
+                    self.pubsub.purge,
+                    target_jid,
+                    target_node,
+                    retry=retry,
+                )
+                if self._item_cache is not None:
+                    self._item_cache.clear(self._bare(target_jid), target_node)
+                return res
+            except PubSubError as e:
+                self._fail(e, f"Error purging node <{target_node}>")
+            finally:
+                self._invalidate_nodes(target_jid)
 
-        async def get_nodes(self, target_jid: str, target_node: Optional[str] = None):
+        async def get_nodes(
+            self,
+            target_jid: str,
+            target_node: Optional[str] = None,
+            retry: Optional[RetryPolicy] = None,
+        ):
             """
             Request all nodes at a service or collection node.
 
             Args:
                 target_jid (str): Address of the PubSub service.
                 target_node (str or None): Name of the collection node to query
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
             """
+            key = (str(target_jid), target_node)
+            if self._node_cache is not None:
+                cached = self._node_cache.get(key)
+                if cached is not None:
+                    return [dict(node) for node in cached]
             try:
-                nodes = await self.pubsub.get_nodes(target_jid, target_node)
-                return [
+                nodes = await self._call(
+                    "get_nodes",
+                    target_node,
+                    self.pubsub.get_nodes,
+                    target_jid,
+                    target_node,
+                    retry=retry,
+                )
+                result = [
                     {"jid": i[0], "node": i[1], "name": i[2]}
                     for i in nodes["disco_items"]["items"]
                 ]
-            except IqError as e:
-                logger.error(f"Error retrieving nodes: {e}")
+                if self._node_cache is not None:
+                    self._node_cache.set(key, [dict(node) for node in result])
+                return result
+            except PubSubError as e:
+                self._fail(e, "Error retrieving nodes")
                 return []
 
         async def get_items(
-            self, target_jid: str, target_node: Optional[str]
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            decode: bool = False,
+            retry: Optional[RetryPolicy] = None,
+            refresh: bool = False,
         ) -> List[tuple[str, str]]:
             """
             Request all items at a service or collection node.
 
+            If the item cache is enabled and holds every item of a node this component
+            is subscribed to, they are returned without contacting the service.
+
             Returns a list of tuples, in the format (id, payload)
             Args:
                 target_jid (str): Address of the PubSub service.
                 target_node (str or None): Name of the PubSub node.
-
+                decode (bool): Return the payloads decoded with their codec.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+                refresh (bool): Request the items to the service even if they are cached.
             """
+            service = self._bare(target_jid)
+            cache = None
+            if self._item_cache is not None and self._subscriptions.is_subscribed(
+                service, target_node, self.client.boundjid.bare
+            ):
+                cache = self._item_cache
+                items = None if refresh else cache.items(service, target_node)
+                if items is not None:
+                    return [
+                        (item_id, self.decode(payload) if decode else payload)
+                        for item_id, payload in items
+                    ]
+                version = cache.version(service, target_node)
             try:
-                data: Iq = await self.pubsub.get_items(target_jid, target_node)
+                data: Iq = await self._call(
+                    "get_items",
+                    target_node,
+                    self.pubsub.get_items,
+                    target_jid,
+                    target_node,
+                    retry=retry,
+                )
                 if data["pubsub"] and data:
                     if data["pubsub"]["items"]["node"] == target_node:
-                        return [
-                            (item["id"], item["payload"])
+                        items = [
+                            (item["id"], inflate_payload(item["payload"]))
                             for item in data["pubsub"]["items"]
                         ]
-            except IqError as e:
-                logger.error(f"Error retrieving items from node <{target_node}>: {e}")
+                        if cache is not None:
+                            cache.load(service, target_node, items, version)
+                        return [
+                            (item_id, self.decode(payload) if decode else payload)
+                            for item_id, payload in items
+                        ]
+            except PubSubError as e:
+                self._fail(e, f"Error retrieving items from node <{target_node}>")
+
+        async def get_items_by_ids(
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            item_ids: Iterable[str],
+            retry: Optional[RetryPolicy] = None,
+        ) -> List[tuple[str, Element]]:
+            """
+            Request some items of a node by their ids.
+
+            Returns a list of tuples, in the format (id, payload)
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str or None): Name of the PubSub node.
+                item_ids (iterable of str): Ids of the items to retrieve.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+            """
+            item_ids = list(item_ids)
+            if not item_ids:
+                return []
+            try:
+                data: Iq = await self._call(
+                    "get_items",
+                    target_node,
+                    self.pubsub.get_items,
+                    target_jid,
+                    target_node,
+                    item_ids=item_ids,
+                    retry=retry,
+                )
+                wanted = set(item_ids)
+                return [
+                    (item["id"], inflate_payload(item["payload"]))
+                    for item in data["pubsub"]["items"]
+                    if item["id"] in wanted
+                ]
+            except PubSubError as e:
+                self._fail(e, f"Error retrieving items from node <{target_node}>")
+
+        async def get_items_since(
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            last_item_id: Optional[str],
+            max_items: Optional[int] = None,
+            retry: Optional[RetryPolicy] = None,
+        ) -> List[tuple[str, Element]]:
+            """
+            Request the items published to a node after `last_item_id`.
+
+            The ids of the items are discovered first, so that only the new items
+            are transferred. XEP-0060 does not define the order in which they are
+            listed, so the listing is only used if its first or last id is the
+            latest item of the node. If the service does not list them, the order
+            cannot be told, or `last_item_id` is no longer in the node, the (at
+            most `max_items`) latest items are requested instead.
+
+            Returns a list of tuples, in the format (id, payload)
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str or None): Name of the PubSub node.
+                last_item_id (str or None): Id of the last item already known.
+                max_items (int or None): Maximum number of items to return.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+            """
+            ids = []
+            if last_item_id is not None:
+                try:
+                    ids = await self._discover_item_ids(target_jid, target_node, retry)
+                except PubSubError as e:
+                    logger.debug(
+                        f"Could not discover items of node <{target_node}>: {e}"
+                    )
+
+            if last_item_id in ids:
+                ids = ids[ids.index(last_item_id) + 1 :]
+                if max_items is not None:
+                    ids = ids[max(len(ids) - max_items, 0) :]
+                return await self.get_items_by_ids(
+                    target_jid, target_node, ids, retry=retry
+                )
+
+            try:
+                data: Iq = await self._call(
+                    "get_items",
+                    target_node,
+                    self.pubsub.get_items,
+                    target_jid,
+                    target_node,
+                    max_items=max_items,
+                    retry=retry,
+                )
+                items = [
+                    (item["id"], inflate_payload(item["payload"]))
+                    for item in data["pubsub"]["items"]
+                ]
+            except PubSubError as e:
+                self._fail(e, f"Error retrieving items from node <{target_node}>")
+                return None
+
+            ids = [item[0] for item in items]
+            if last_item_id is not None and last_item_id in ids:
+                items = items[ids.index(last_item_id) + 1 :]
+            if max_items is not None:
+                items = items[max(len(items) - max_items, 0) :]
+            return items
+
+        async def _discover_item_ids(
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            retry: Optional[RetryPolicy],
+        ) -> List[str]:
+            # Items are discovered as disco items of the node, which have a
+            # name but no node attribute (XEP-0060, 5.5).
+            data = await self._call(
+                "get_nodes",
+                target_node,
+                self.pubsub.get_nodes,
+                target_jid,
+                target_node,
+                retry=retry,
+            )
+            ids = [i[2] for i in data["disco_items"]["items"] if not i[1]]
+            if not ids:
+                return ids
+            # The order of the listing is not specified, but the service must
+            # return the most recent item when asked for one (XEP-0060, 6.5.7).
+            data = await self._call(
+                "get_items",
+                target_node,
+                self.pubsub.get_items,
+                target_jid,
+                target_node,
+                max_items=1,
+                retry=retry,
+            )
+            latest = [item["id"] for item in data["pubsub"]["items"]]
+            if latest == ids[-1:]:
+                return ids
+            if latest == ids[:1]:
+                return ids[::-1]
+            return []
+
+        async def iter_items(
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            page_size: int = 50,
+            max_items: Optional[int] = None,
+            retry: Optional[RetryPolicy] = None,
+        ) -> AsyncIterator[tuple[str, Element]]:
+            """
+            Iterate over the items of a node, requesting them in pages of
+            `page_size` items with Result Set Management (XEP-0059).
+
+            Yields tuples, in the format (id, payload). If the service does not
+            support Result Set Management, all the items arrive in the first page.
+
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str or None): Name of the PubSub node.
+                page_size (int): Maximum number of items requested at once.
+                max_items (int or None): Stop after yielding this many items.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+            """
+            if page_size < 1:
+                raise ValueError("page_size must be greater than 0")
+
+            yielded = 0
+            after = None
+            while max_items is None or yielded < max_items:
+                amount = page_size
+                if max_items is not None:
+                    amount = min(page_size, max_items - yielded)
+
+                iq = self.client.Iq(sto=target_jid, stype="get")
+                iq["pubsub"]["items"]["node"] = target_node
+                iq["pubsub"]["rsm"]["max"] = str(amount)
+                if after:
+                    iq["pubsub"]["rsm"]["after"] = after
+                try:
+                    data: Iq = await self._call(
+                        "get_items", target_node, iq.send, retry=retry
+                    )
+                except PubSubError as e:
+                    self._fail(e, f"Error retrieving items from node <{target_node}>")
+                    return
+
+                page = data["pubsub"]["items"]
+                for item in page:
+                    yield item["id"], inflate_payload(item["payload"])
+                    yielded += 1
+                    if max_items is not None and yielded >= max_items:
+                        return
+
+                after = data["pubsub"]["rsm"]["last"]
+                if not after or len(page) < amount:
+                    return
 
         # SUBSCRIBER USE CASES
 
@@ -184,6 +728,8 @@ class PubSubMixin:
             target_node: Optional[str] = None,
             subscription_jid: Optional[str] = None,
             config=None,
+            retry: Optional[RetryPolicy] = None,
+            item_filter: Optional[ItemFilter] = None,
         ):
             """
             Subscribe to a node.
@@ -193,15 +739,23 @@ class PubSubMixin:
                 target_node (str): Name of the PubSub node to subscribe to.
                 subscription_jid (str): The address to subscribe to the service.
                 config (Data): Optional configuration of the subscription
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+                item_filter (ItemFilter or None): Filter of the items of the node that
+                    reach the published item callbacks. Its subscription options are
+                    sent as `config` if none is given.
             """
+            if item_filter is not None and item_filter.options and config is None:
+                config = self._subscription_options(item_filter.options)
             try:
-                sub = await self.pubsub.subscribe(
-                    target_jid, target_node, subscribee=subscription_jid, options=config
+                subid = await self._subscribe(
+                    target_jid, target_node, subscription_jid, config, retry
                 )
-                if sub["pubsub"] and sub["pubsub"]["subscription"]:
-                    return sub["pubsub"]["subscription"]["subid"]
-            except IqError as e:
-                logger.error(f"Error subscribing to node <{target_node}>: {e}")
+                if item_filter is not None:
+                    self.set_node_filter(target_node, item_filter, target_jid)
+                return subid
+            except PubSubError as e:
+                self._fail(e, f"Error subscribing to node <{target_node}>")
 
         async def unsubscribe(
             self,
@@ -209,6 +763,7 @@ class PubSubMixin:
             target_node: Optional[str] = None,
             subscription_jid: Optional[str] = None,
             subid=None,
+            retry: Optional[RetryPolicy] = None,
         ):
             """
             Unsubscribe from a node.
@@ -217,96 +772,1604 @@ class PubSubMixin:
                 target_jid (str): Address of the PubSub service.
                 target_node (str): Name of the PubSub node to unsubscribe from.
                 subscription_jid (str): The address to subscribe from the service.
-                subid (str): Unique ID of the subscription to remove.
+                subid (str): Unique ID of the subscription to remove. By default, the
+                    one of the known subscription of the address, if any.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
             """
             try:
-                return await self.pubsub.unsubscribe(
-                    target_jid,
-                    target_node,
-                    subscribee=subscription_jid,
-                    subid=subid,
+                return await self._unsubscribe(
+                    target_jid, target_node, subscription_jid, subid, retry
                 )
-            except IqError as e:
-                logger.error(f"Error unsubscribing to node <{target_node}>: {e}")
-
-        def set_on_item_published(self, callback):
-            self.client.add_event_handler("pubsub_publish", callback)
-
-        def set_on_item_retracted(self, callback):
-            self.client.add_event_handler("pubsub_retract", callback)
+            except PubSubError as e:
+                self._fail(e, f"Error unsubscribing to node <{target_node}>")
 
-        # PUBLISHER USE CASES
-
-        async def notify(self, target_jid: str, target_node: str):
+        async def subscribe_many(
+            self,
+            target_jid: str,
+            target_nodes: Iterable[str],
+            max_concurrency: int = 10,
+            config=None,
+            retry: Optional[RetryPolicy] = None,
+        ) -> dict[str, Union[Optional[str], PubSubError]]:
             """
-            Notify all subscribers of a node without publishing an item.
-            “Publish” to the node at jid without any item. This merely fans out a notification.
+            Subscribe to several nodes, keeping up to `max_concurrency` subscription
+            requests on the wire at the same time.
+
+            Nodes this component is already subscribed to are not requested again.
 
             Args:
                 target_jid (str): Address of the PubSub service.
-                target_node (str): Name of the PubSub node to send a notify from.
+                target_nodes (iterable of str): Names of the PubSub nodes to subscribe to.
+                max_concurrency (int): Maximum number of unanswered requests.
+                config (Data): Optional configuration of the subscriptions
+                retry (RetryPolicy or None): Retry policy of these calls, instead of
+                    the one of the component.
+
+            Return:
+                A dictionary mapping each node to the subid of its subscription, or
+                to the PubSubError of the failed subscriptions.
             """
-            try:
-                await self.pubsub.publish(target_jid, target_node)
-            except IqError as e:
-                logger.error(f"Error notifying to node <{target_node}>: {e}")
+            service = self._bare(target_jid)
+            jid = self.client.boundjid.bare
+            results = {}
+            pending = []
+            for node in dict.fromkeys(target_nodes):
+                if self._subscriptions.is_subscribed(service, node, jid):
+                    results[node] = self._subscriptions.subid(service, node, jid)
+                else:
+                    pending.append(node)
 
-        async def publish(
+            async def _subscribe(node):
+                return await self._subscribe(target_jid, node, None, config, retry)
+
+            results.update(
+                await self._run_many("subscribe", pending, _subscribe, max_concurrency)
+            )
+            return results
+
+        async def unsubscribe_many(
             self,
             target_jid: str,
-            target_node: str,
-            payload: Union[Element, str],
-            item_id: Optional[str] = None,
-            ifrom: str = None,
-        ) -> Union[str, Iq]:
+            target_nodes: Iterable[str],
+            max_concurrency: int = 10,
+            retry: Optional[RetryPolicy] = None,
+        ) -> dict[str, Optional[PubSubError]]:
             """
-            Publish an item to a node.
+            Unsubscribe from several nodes, keeping up to `max_concurrency`
+            requests on the wire at the same time.
 
             Args:
                 target_jid (str): Address of the PubSub service.
-                target_node (str): Name of the PubSub node to publish to.
-                payload (Element | str): Payload to publish.
-                item_id (str or None): Item ID to use for the item.
+                target_nodes (iterable of str): Names of the PubSub nodes to unsubscribe from.
+                max_concurrency (int): Maximum number of unanswered requests.
+                retry (RetryPolicy or None): Retry policy of these calls, instead of
+                    the one of the component.
 
             Return:
-                The response of the server
+                A dictionary mapping each node to None, or to the PubSubError of
+                the failed requests.
             """
-            try:
-                payload_stanza = Element("payload", attrib={"xmlns": "spade.pubsub"})
-                payload_stanza.text = payload
 
-                res = await self.pubsub.publish(
-                    target_jid, target_node, item_id, payload_stanza, ifrom=ifrom
-                )
-                if (
-                    item_id is None
-                    and res["pubsub"]
-                    and res["pubsub"]["publish"]
-                    and res["pubsub"]["publish"]["item"]
-                ):
-                    return res["pubsub"]["publish"]["item"]["id"]
-            except IqError as e:
-                logger.error(
-                    f"Error publishing item <{item_id or 'undefined'}> to node <{target_node}>: {e}"
-                )
+            async def _unsubscribe(node):
+                await self._unsubscribe(target_jid, node, None, None, retry)
 
-        async def retract(
-            self, target_jid: str, target_node: str, item_id: str, notify=False
+            return await self._run_many(
+                "unsubscribe",
+                list(dict.fromkeys(target_nodes)),
+                _unsubscribe,
+                max_concurrency,
+            )
+
+        def set_on_item_published(self, callback, decode: bool = False):
+            self._published_routes.add(None, None, self._wrap(callback, decode))
+
+        def set_on_item_retracted(self, callback, decode: bool = False):
+            self._retracted_routes.add(None, None, self._wrap(callback, decode))
+
+        def on_item_published(
+            self,
+            target_node: Optional[str],
+            callback: Callable[[Message], None],
+            target_jid: Optional[str] = None,
+            decode: bool = False,
         ):
             """
-            Retract a previously published item from a node.
+            Call `callback` with the notifications of items published to a node.
 
             Args:
-                target_jid (str): Address of the PubSub service.
-                target_node (str): Name of the PubSub node to send a notify from.
-                item_id (str): The ID of the item to retract.
-                notify (bool): Flag indicating whether subscribers shall be notified about the retraction.
+                target_node (str or None): Name of the PubSub node, or None for any node.
+                callback (callable): Called with the notification message.
+                target_jid (str or None): Address of the PubSub service, or None for any service.
+                decode (bool): Call `callback` with a PubSubItem for each item of the
+                    notification, with its payload decoded, instead of the message.
             """
-            try:
-                return await self.pubsub.retract(
-                    target_jid, target_node, item_id, notify
-                )
-            except IqError as e:
-                logger.error(
-                    f"Error retracting item <{item_id}> to node <{target_node}>: {e}"
-                )
+            self._published_routes.add(
+                self._bare(target_jid), target_node, self._wrap(callback, decode)
+            )
+
+        def off_item_published(
+            self,
+            target_node: Optional[str],
+            callback: Optional[Callable[[Message], None]] = None,
+            target_jid: Optional[str] = None,
+        ):
+            """
+            Stop calling `callback`, or every callback if None, for a node.
+
+            Args:
+                target_node (str or None): Name of the PubSub node, or None for any node.
+                callback (callable or None): The callback to remove.
+                target_jid (str or None): Address of the PubSub service, or None for any service.
+            """
+            self._published_routes.remove(self._bare(target_jid), target_node, callback)
+
+        def on_item_retracted(
+            self,
+            target_node: Optional[str],
+            callback: Callable[[Message], None],
+            target_jid: Optional[str] = None,
+            decode: bool = False,
+        ):
+            """
+            Call `callback` with the notifications of items retracted from a node.
+
+            Args:
+                target_node (str or None): Name of the PubSub node, or None for any node.
+                callback (callable): Called with the notification message.
+                target_jid (str or None): Address of the PubSub service, or None for any service.
+                decode (bool): Call `callback` with a PubSubItem for each item of the
+                    notification, with its payload decoded, instead of the message.
+            """
+            self._retracted_routes.add(
+                self._bare(target_jid), target_node, self._wrap(callback, decode)
+            )
+
+        def off_item_retracted(
+            self,
+            target_node: Optional[str],
+            callback: Optional[Callable[[Message], None]] = None,
+            target_jid: Optional[str] = None,
+        ):
+            """
+            Stop calling `callback`, or every callback if None, for a node.
+
+            Args:
+                target_node (str or None): Name of the PubSub node, or None for any node.
+                callback (callable or None): The callback to remove.
+                target_jid (str or None): Address of the PubSub service, or None for any service.
+            """
+            self._retracted_routes.remove(self._bare(target_jid), target_node, callback)
+
+        def register_codec(self, codec: Codec):
+            """
+            Make a payload codec available by its name.
+
+            Args:
+                codec (Codec): The codec to register.
+            """
+            self._codecs[codec.name] = codec
+
+        def set_node_codec(
+            self,
+            target_node: str,
+            codec: Optional[str],
+            target_jid: Optional[str] = None,
+        ):
+            """
+            Set the codec used to publish to a node when none is given to `publish`.
+
+            Args:
+                target_node (str): Name of the PubSub node.
+                codec (str or None): Name of the codec, or None to restore the default.
+                target_jid (str or None): Address of the PubSub service, or None for any service.
+            """
+            key = (self._bare(target_jid), target_node)
+            if codec is None:
+                self._node_codecs.pop(key, None)
+                return
+            self._get_codec(codec)
+            self._node_codecs[key] = codec
+
+        def set_retry_policy(self, policy: RetryPolicy):
+            """
+            Set the timeout and retries of the requests sent to the PubSub service.
+
+            The policy applies to every request unless another one is passed in the
+            `retry` argument of the call. Requests that still fail are logged and
+            return None, or raise a PubSubError if `raise_errors` is set.
+
+            Args:
+                policy (RetryPolicy): The policy of the requests.
+            """
+            self._retry_policy = policy
+
+        def enable_metrics(
+            self,
+            exporter: Optional[Callable[[dict], None]] = None,
+            interval: Optional[float] = None,
+            per_node: bool = True,
+        ) -> Metrics:
+            """
+            Measure the latency and outcome of every request sent to the PubSub
+            service, the requests in flight and the notifications received.
+
+            Args:
+                exporter (callable or None): Called with a snapshot of the metrics
+                    every `interval` seconds.
+                interval (float or None): Seconds between exports.
+                per_node (bool): Keep a latency histogram for each node too.
+
+            Return:
+                The Metrics object, whose `snapshot()` returns the current values.
+            """
+            self.disable_metrics()
+            self._metrics = Metrics(per_node=per_node)
+            if exporter is not None:
+                self._metrics.add_exporter(exporter)
+            if interval is not None:
+                self._metrics.start_exporting(interval)
+            return self._metrics
+
+        def disable_metrics(self):
+            """
+            Stop measuring the requests and notifications.
+            """
+            if self._metrics is not None:
+                self._metrics.stop_exporting()
+            self._metrics = None
+
+        @property
+        def metrics(self) -> Optional[Metrics]:
+            return self._metrics
+
+        def enable_rate_limit(
+            self,
+            rate: float = 100.0,
+            burst: Optional[float] = None,
+            min_rate: float = 1.0,
+            max_rate: Optional[float] = None,
+            increase: float = 1.0,
+            decrease: float = 0.5,
+            pushback: Iterable[str] = PUSHBACK_CONDITIONS,
+        ) -> RateLimiter:
+            """
+            Limit the rate of the items published to each node of each service.
+
+            The rate of a node grows by about `increase` items per second every
+            second while the service accepts the items, and is multiplied by
+            `decrease` when it rejects one with an error condition in `pushback`.
+
+            Args:
+                rate (float): Initial rate, in items per second.
+                burst (float or None): Items that can be published at once after an
+                    idle period. By default, one second worth of items.
+                min_rate (float): Minimum rate, in items per second.
+                max_rate (float or None): Maximum rate, in items per second.
+                increase (float): Additive increase of the rate.
+                decrease (float): Multiplicative decrease of the rate.
+                pushback (iterable of str): Error conditions that decrease the rate.
+
+            Return:
+                The RateLimiter, whose `rate(service, node)` returns the current
+                rate of a node.
+            """
+            self._rate_limiter = RateLimiter(
+                rate, burst, min_rate, max_rate, increase, decrease, pushback
+            )
+            return self._rate_limiter
+
+        def disable_rate_limit(self):
+            """
+            Stop limiting the rate of the published items.
+            """
+            self._rate_limiter = None
+
+        def enable_loopback(
+            self, bus: Optional[LoopbackBus] = None, ttl: float = 60.0
+        ) -> LoopbackBus:
+            """
+            Deliver the items published by the agents of this process to each other
+            directly, as well as through the service.
+
+            When an item is published to a node that components of the same bus are
+            subscribed to, their published item callbacks are called right away with
+            a notification built in memory, before the service acknowledges the item.
+            The item is still published to the service for its remote subscribers, and
+            the notification the service sends for it is ignored if it carries the
+            item id. Items published without id get one generated locally, so that
+            notification can be told apart. Services that leave the ids out of their
+            notifications deliver the item a second time.
+
+            Args:
+                bus (LoopbackBus or None): Bus to join. By default, the one shared by
+                    the whole process.
+                ttl (float): Seconds the ids of the delivered items are remembered to
+                    ignore their notification from the service.
+
+            Return:
+                The LoopbackBus joined.
+            """
+            self.disable_loopback()
+            self._loopback = default_bus if bus is None else bus
+            self._loopback_delivered = TTLCache(maxsize=4096, ttl=ttl)
+            for key in self._subscriptions.nodes(self.client.boundjid.bare):
+                self._loopback.subscribe(*key, self)
+            return self._loopback
+
+        def disable_loopback(self):
+            """
+            Leave the loopback bus, receiving every item through the service again.
+            """
+            if self._loopback is not None:
+                self._loopback.remove(self)
+            self._loopback = None
+            self._loopback_delivered = None
+
+        def enable_deduplication(
+            self, maxsize: int = 10000, ttl: Optional[float] = None
+        ) -> SeenItems:
+            """
+            Drop the items that have already been received from the publish
+            notifications before they reach the published item callbacks.
+
+            Items are recognised by their service, node and id, and the last `maxsize`
+            ids received from any node are remembered. A retracted item is forgotten,
+            so it is delivered again if it is published again.
+
+            Args:
+                maxsize (int): Maximum number of item ids remembered.
+                ttl (float or None): Seconds an item id is remembered. By default,
+                    until it is evicted by newer items.
+
+            Return:
+                The SeenItems, whose `dropped` attribute counts the dropped items.
+            """
+            self._seen_items = SeenItems(maxsize, ttl)
+            return self._seen_items
+
+        def disable_deduplication(self):
+            """
+            Deliver every publish notification to the callbacks again.
+            """
+            self._seen_items = None
+
+        def enable_recovery(self, max_items: int = 50, max_concurrency: int = 10):
+            """
+            Call `recover` every time the agent connects again.
+
+            Args:
+                max_items (int): Maximum number of missed items requested for each node.
+                max_concurrency (int): Maximum number of nodes recovered at the same time.
+            """
+            self._recovery = (max_items, max_concurrency)
+
+        def disable_recovery(self):
+            """
+            Stop recovering the subscriptions and missed items after reconnecting.
+            """
+            self._recovery = None
+            self._last_seen.clear()
+
+        async def recover(
+            self,
+            max_items: int = 50,
+            max_concurrency: int = 10,
+            retry: Optional[RetryPolicy] = None,
+        ) -> dict[tuple[str, str], Union[int, PubSubError]]:
+            """
+            Restore the subscriptions of this component after a reconnection and
+            deliver the items published in the meantime to the published item callbacks.
+
+            The subscriptions the services no longer have are requested again. Then,
+            for up to `max_concurrency` nodes at the same time, the items published
+            after the last one received from each node are requested (see
+            `get_items_since`). With recovery enabled, the latest item of a node is
+            recorded when subscribing to it, so nodes that were empty then get their
+            latest items. Nodes whose latest item is not known are only subscribed
+            again, as their items may have been received already.
+
+            Args:
+                max_items (int): Maximum number of missed items requested for each node.
+                max_concurrency (int): Maximum number of nodes recovered at the same time.
+                retry (RetryPolicy or None): Retry policy of the requests, instead of
+                    the one of the component.
+
+            Return:
+                A dictionary mapping each (service, node) pair to the number of items
+                delivered, or to the PubSubError of the nodes that failed.
+            """
+            nodes: dict[str, List[str]] = {}
+            for service, node in self._subscriptions.nodes(self.client.boundjid.bare):
+                nodes.setdefault(service, []).append(node)
+
+            results = {}
+            for service, service_nodes in nodes.items():
+                missing = await self._missing_subscriptions(
+                    service, service_nodes, retry
+                )
+
+                async def _recover(node, service=service, missing=missing):
+                    last_item_id = self._last_seen.get((service, node))
+                    if node in missing:
+                        await self._subscribe(service, node, None, None, retry)
+                    if last_item_id is None:
+                        return 0
+                    items = await self.get_items_since(
+                        service,
+                        node,
+                        last_item_id or None,
+                        max_items,
+                        retry=retry,
+                    )
+                    for item_id, payload in items or ():
+                        self._publish_locally(service, node, item_id, payload)
+                    if items:
+                        self._last_seen[(service, node)] = items[-1][0]
+                    return len(items or ())
+
+                recovered = await self._run_many(
+                    "recover", service_nodes, _recover, max_concurrency
+                )
+                results.update(
+                    ((service, node), result) for node, result in recovered.items()
+                )
+            return results
+
+        def enable_item_cache(self, size: int = 20):
+            """
+            Keep the last `size` items of the nodes this component is subscribed to,
+            updated with the notifications of their services, and answer `get_items`
+            with them while they hold every item of the node.
+
+            The cache drops the oldest items of a node beyond its `pubsub#max_items`,
+            as the service does, when the node was created by this component with that
+            option. Otherwise it stops answering for a node once it grows beyond the
+            items it held when they were requested.
+
+            Args:
+                size (int): Maximum number of items kept for each node.
+            """
+            self._item_cache = ItemCache(size)
+
+        def disable_item_cache(self):
+            """
+            Stop caching the items of the subscribed nodes.
+            """
+            self._item_cache = None
+
+        def enable_compression(self, threshold: int = 16384, level: int = 6):
+            """
+            Compress the text payloads of at least `threshold` bytes before publishing them.
+
+            Compressed payloads are deflated with zlib, encoded in base64 and marked with
+            an `encoding="deflate"` attribute. They are decompressed automatically when
+            received by the published item callbacks and by the item retrieval methods.
+
+            Args:
+                threshold (int): Minimum size in bytes of the payloads to compress.
+                level (int): zlib compression level, from 1 (fastest) to 9 (smallest).
+            """
+            self._compression = (threshold, level)
+
+        def disable_compression(self):
+            """
+            Publish all payloads uncompressed.
+            """
+            self._compression = None
+
+        def decode(self, payload: Optional[Element]):
+            """
+            Decode the payload of an item with the codec it was published with.
+
+            Args:
+                payload (Element or None): The payload element of the item.
+            """
+            if payload is None:
+                return None
+            inflate_payload(payload)
+            return self._get_codec(payload.get("codec", "")).decode(payload)
+
+        def decode_items(self, msg: Message) -> List[PubSubItem]:
+            """
+            Return the items of a notification message, with their payloads decoded.
+
+            Args:
+                msg (Message): A published or retracted items notification.
+            """
+            service = msg["from"].bare
+            node = msg["pubsub_event"]["items"]["node"]
+            return [
+                PubSubItem(
+                    service,
+                    node,
+                    item["id"],
+                    self.decode(item["payload"]) if item.name == "item" else None,
+                )
+                for item in msg["pubsub_event"]["items"].iterables
+            ]
+
+        def stream(
+            self,
+            target_jid: str,
+            target_node: str,
+            maxsize: int = 100,
+            overflow: str = "block",
+            subscribe: bool = True,
+            decode: bool = False,
+            max_blocked: Optional[int] = None,
+        ) -> PubSubStream:
+            """
+            Return an asynchronous iterator over the notifications of a node.
+
+            Use it as ``async with pubsub.stream(jid, node) as stream: async for msg in stream``.
+            The node is subscribed on enter and unsubscribed on exit.
+
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str): Name of the PubSub node.
+                maxsize (int): Maximum number of notifications waiting to be consumed.
+                overflow (str): What to do when `maxsize` is reached: "block",
+                    "drop_oldest", "drop_newest" or "keep_latest".
+                subscribe (bool): Subscribe to the node on enter and unsubscribe on exit.
+                decode (bool): Yield a PubSubItem for each published item, with its
+                    payload decoded, instead of the notification messages.
+                max_blocked (int or None): Maximum number of notifications held back
+                    by the "block" policy, `maxsize` by default.
+            """
+            return PubSubStream(
+                self,
+                target_jid,
+                target_node,
+                maxsize=maxsize,
+                overflow=overflow,
+                subscribe=subscribe,
+                decode=decode,
+                max_blocked=max_blocked,
+            )
+
+        def enable_callback_executor(
+            self,
+            max_concurrency: int = 8,
+            max_pending: int = 1000,
+            overflow: str = "block",
+            run_in_thread: bool = False,
+            max_blocked: Optional[int] = None,
+        ):
+            """
+            Run the published and retracted callbacks outside of the XMPP event path.
+
+            Notifications of the same node are handled in arrival order, while the
+            notifications of up to `max_concurrency` nodes are handled at the same
+            time. Callbacks may be coroutine functions.
+
+            Args:
+                max_concurrency (int): Maximum number of nodes handled at the same time.
+                max_pending (int): Maximum number of notifications waiting to be handled.
+                overflow (str): What to do when `max_pending` is reached: "block"
+                    (hold back up to `max_blocked` notifications until there is
+                    room), "drop_newest" or "drop_oldest".
+                run_in_thread (bool): Run plain function callbacks in the default
+                    thread pool executor of the event loop.
+                max_blocked (int or None): Maximum number of notifications held back
+                    by the "block" policy, `max_pending` by default.
+            """
+            self._executor = CallbackExecutor(
+                max_concurrency=max_concurrency,
+                max_pending=max_pending,
+                overflow=overflow,
+                run_in_thread=run_in_thread,
+                max_blocked=max_blocked,
+            )
+
+        def disable_callback_executor(self):
+            """
+            Run the published and retracted callbacks inline again.
+            """
+            self._executor = None
+
+        def set_node_filter(
+            self,
+            target_node: str,
+            item_filter: Optional[ItemFilter],
+            target_jid: Optional[str] = None,
+        ):
+            """
+            Only call the published item callbacks of a node with the items accepted
+            by a filter. Notifications are dropped if none of their items is accepted.
+
+            Args:
+                target_node (str): Name of the PubSub node.
+                item_filter (ItemFilter or None): The filter, or None to remove it.
+                target_jid (str or None): Address of the PubSub service. By default,
+                    the node of any service.
+            """
+            key = (self._bare(target_jid), target_node)
+            if item_filter is None:
+                self._filters.pop(key, None)
+            else:
+                self._filters[key] = item_filter
+
+        async def enable_stream_pool(
+            self,
+            size: int = 4,
+            node_affinity: bool = True,
+            timeout: float = 30.0,
+            keepalive_interval: float = 60.0,
+        ) -> StreamPool:
+            """
+            Open `size` extra streams of the account of the agent and publish through
+            them, so that publications are not serialized on the stream of the agent.
+
+            The streams are bound to their own resources and do not send presence,
+            so notifications are still received by the agent. A stream that
+            disconnects is connected again with an increasing delay, and is not used
+            until it reconnects; if none is connected, the stream of the agent is used. They are closed when the agent disconnects.
+
+            Args:
+                size (int): Number of extra streams.
+                node_affinity (bool): Publish the items of each node through the same
+                    stream, which keeps their order. Otherwise the streams are used
+                    in turns.
+                timeout (float): Seconds to wait for the streams to connect.
+                keepalive_interval (float): Seconds between the pings each stream
+                    sends to detect a dead connection and reconnect.
+
+            Return:
+                The StreamPool.
+            """
+            await self.disable_stream_pool()
+            pool = StreamPool(self.client, size, node_affinity, keepalive_interval)
+            await pool.start(timeout)
+            self._stream_pool = pool
+            self.client.add_event_handler(
+                "disconnected", self._on_disconnected, disposable=True
+            )
+            return pool
+
+        async def disable_stream_pool(self):
+            """
+            Close the extra streams and publish through the stream of the agent again.
+            """
+            pool, self._stream_pool = self._stream_pool, None
+            if pool is not None:
+                await pool.stop()
+
+        def _on_disconnected(self, _event):
+            asyncio.ensure_future(self.disable_stream_pool())
+
+        def enable_outbox(
+            self,
+            path: str,
+            commit_interval: float = 0.01,
+            max_batch: int = 100,
+        ) -> Outbox:
+            """
+            Store the items in a sqlite database before publishing them, and keep
+            them until the service acknowledges them.
+
+            Items that could not be published, unless the service rejected them with
+            one of the `PERMANENT_CONDITIONS` of the outbox, are published again when
+            the agent connects again, when the outbox is enabled with items from a
+            previous run, or with `replay_outbox`.
+            Items published without id get one generated locally, so that publishing
+            them again replaces them instead of duplicating them.
+
+            Args:
+                path (str): Path of the database file.
+                commit_interval (float): Seconds the writes are batched before being
+                    committed to disk.
+                max_batch (int): Number of writes that are committed without waiting
+                    for `commit_interval`.
+
+            Return:
+                The Outbox.
+            """
+            self.disable_outbox()
+            self._outbox = Outbox(path, commit_interval, max_batch)
+            if len(self._outbox):
+                asyncio.ensure_future(self.replay_outbox())
+            return self._outbox
+
+        def disable_outbox(self):
+            """
+            Close the outbox. Its items are kept on disk.
+            """
+            outbox, self._outbox = self._outbox, None
+            if outbox is not None:
+                outbox.close()
+
+        async def replay_outbox(self, max_in_flight: int = 10) -> int:
+            """
+            Publish the items of the outbox that are not being published, keeping up
+            to `max_in_flight` publish requests on the wire at the same time.
+
+            Args:
+                max_in_flight (int): Maximum number of unanswered publish requests.
+
+            Return:
+                The number of items published.
+            """
+            outbox = self._outbox
+            if outbox is None:
+                return 0
+            entries = await outbox.take()
+            pending = iter(entries)
+            published = 0
+
+            async def _worker():
+                nonlocal published
+                for entry, service, node, item_id, payload in pending:
+                    try:
+                        await self._call(
+                            "publish",
+                            node,
+                            self._publisher(service, node),
+                            service,
+                            node,
+                            item_id,
+                            payload,
+                        )
+                    except BaseException as e:
+                        self._settle(outbox, entry, e)
+                        if not isinstance(e, PubSubError):
+                            raise
+                        logger.error(
+                            f"Error replaying item <{item_id}> to node <{node}>: {e}"
+                        )
+                    else:
+                        self._settle(outbox, entry, None)
+                        published += 1
+
+            try:
+                await asyncio.gather(
+                    *(_worker() for _ in range(min(max_in_flight, len(entries))))
+                )
+            finally:
+                for entry, *_ in pending:
+                    outbox.release(entry)
+            return published
+
+        def enable_conflation(
+            self, target_node: str, target_jid: Optional[str] = None
+        ) -> Conflator:
+            """
+            Deliver only the latest item of a node to the published item callbacks
+            when its items arrive faster than the callbacks handle them.
+
+            The publish notifications of the node that arrive while its callbacks are
+            running replace each other, and the callbacks run once more with the
+            latest one when they finish. Retractions are not conflated.
+
+            Args:
+                target_node (str): Name of the PubSub node.
+                target_jid (str or None): Address of the PubSub service. By default,
+                    the node of any service.
+
+            Return:
+                The Conflator, whose `conflated` attribute counts the skipped items.
+            """
+            self._conflated_nodes.add((self._bare(target_jid), target_node))
+            return self._conflator
+
+        def disable_conflation(
+            self, target_node: str, target_jid: Optional[str] = None
+        ):
+            """
+            Deliver every item of a node to the published item callbacks again.
+            """
+            self._conflated_nodes.discard((self._bare(target_jid), target_node))
+
+        def _on_publish(self, msg: Message):
+            if self._is_loopback_echo(msg):
+                return
+            self._handle_published(msg)
+
+        def _handle_published(self, msg: Message):
+            if self._metrics is not None:
+                self._metrics.notification(
+                    "publish", msg["pubsub_event"]["items"]["node"]
+                )
+            if self._seen_items is not None:
+                msg = self._drop_repeated(msg)
+                if msg is None:
+                    return
+            # slixmpp is iterating over these items while it runs the handlers
+            # and stanza iterators share their position, so use the plain list.
+            for item in msg["pubsub_event"]["items"].iterables:
+                inflate_payload(item["payload"])
+            if self._item_cache is not None:
+                self._cache_items(msg)
+            if self._recovery is not None:
+                key = (msg["from"].bare, msg["pubsub_event"]["items"]["node"])
+                for item in msg["pubsub_event"]["items"].iterables:
+                    if item.name == "item" and item["id"]:
+                        self._last_seen[key] = item["id"]
+            if self._filters and not self._accepts(msg):
+                return
+            self._dispatch(self._published_routes, msg, conflate=True)
+
+        def _on_retract(self, msg: Message):
+            if self._metrics is not None:
+                self._metrics.notification(
+                    "retract", msg["pubsub_event"]["items"]["node"]
+                )
+            if self._item_cache is not None:
+                self._cache_items(msg)
+            if self._seen_items is not None:
+                key = (msg["from"].bare, msg["pubsub_event"]["items"]["node"])
+                for item in msg["pubsub_event"]["items"].iterables:
+                    self._seen_items.discard(*key, item["id"])
+            self._dispatch(self._retracted_routes, msg)
+
+        def _drop_repeated(self, msg: Message) -> Optional[Message]:
+            key = (msg["from"].bare, msg["pubsub_event"]["items"]["node"])
+            items = msg["pubsub_event"]["items"].iterables
+            repeated = [
+                index
+                for index, item in enumerate(items)
+                if item.name == "item" and not self._seen_items.add(*key, item["id"])
+            ]
+            if not repeated:
+                return msg
+            if self._metrics is not None:
+                for _ in repeated:
+                    self._metrics.notification("duplicate", key[1])
+            if len(repeated) == len(items):
+                return None
+            # slixmpp is still iterating over the items of the original message
+            msg = copy.copy(msg)
+            for index in reversed(repeated):
+                msg["pubsub_event"]["items"].pop(index)
+            return msg
+
+        @staticmethod
+        def _max_items(config_form: Form) -> Optional[int]:
+            try:
+                max_items = int(config_form.get_values().get("pubsub#max_items"))
+            except (TypeError, ValueError):
+                return None
+            return max_items if max_items > 0 else None
+
+        def _cache_items(self, msg: Message):
+            key = (msg["from"].bare, msg["pubsub_event"]["items"]["node"])
+            for item in msg["pubsub_event"]["items"].iterables:
+                if item.name == "retract":
+                    self._item_cache.remove(*key, item["id"])
+                elif item["id"] and item["payload"] is not None:
+                    self._item_cache.add(*key, item["id"], item["payload"])
+                else:
+                    # Items sent without id or payload cannot be mirrored
+                    self._item_cache.invalidate(*key)
+
+        def _accepts(self, msg: Message) -> bool:
+            node = msg["pubsub_event"]["items"]["node"]
+            item_filter = self._filters.get((msg["from"].bare, node))
+            if item_filter is None:
+                item_filter = self._filters.get((None, node))
+            if item_filter is None:
+                return True
+            items = [
+                item
+                for item in msg["pubsub_event"]["items"].iterables
+                if item.name == "item"
+            ]
+            return not items or any(
+                item_filter.matches(item["payload"], self.decode) for item in items
+            )
+
+        def _dispatch(self, routes: EventRouter, msg: Message, conflate: bool = False):
+            key = (msg["from"].bare, msg["pubsub_event"]["items"]["node"])
+            callbacks = routes.match(*key)
+            if not callbacks:
+                return
+            if (
+                conflate
+                and self._conflated_nodes
+                and (
+                    key in self._conflated_nodes
+                    or (None, key[1]) in self._conflated_nodes
+                )
+            ):
+                self._conflator.submit(key, callbacks, msg)
+                return
+            if self._executor is not None:
+                self._executor.submit(key, callbacks, msg)
+                return
+            for callback in callbacks:
+                run_callback(callback, msg)
+
+        # PUBLISHER USE CASES
+
+        async def notify(
+            self, target_jid: str, target_node: str, retry: Optional[RetryPolicy] = None
+        ):
+            """
+            Notify all subscribers of a node without publishing an item.
+            “Publish” to the node at jid without any item. This merely fans out a notification.
+
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str): Name of the PubSub node to send a notify from.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+            """
+            try:
+                await self._call(
+                    "notify",
+                    target_node,
+                    self._publisher(target_jid, target_node),
+                    target_jid,
+                    target_node,
+                    retry=retry,
+                )
+            except PubSubError as e:
+                self._fail(e, f"Error notifying to node <{target_node}>")
+
+        async def publish(
+            self,
+            target_jid: str,
+            target_node: str,
+            payload: Union[Element, str],
+            item_id: Optional[str] = None,
+            ifrom: str = None,
+            codec: Optional[str] = None,
+            retry: Optional[RetryPolicy] = None,
+        ) -> Union[str, Iq]:
+            """
+            Publish an item to a node.
+
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str): Name of the PubSub node to publish to.
+                payload (Element | str): Payload to publish.
+                item_id (str or None): Item ID to use for the item.
+                codec (str or None): Name of the codec used to encode the payload.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+
+            Return:
+                The response of the server
+            """
+            try:
+                published_id = await self._publish_item(
+                    target_jid,
+                    target_node,
+                    item_id,
+                    self._encode(target_jid, target_node, payload, codec),
+                    ifrom,
+                    retry,
+                )
+                if item_id is None:
+                    return published_id
+            except PubSubError as e:
+                self._fail(
+                    e,
+                    f"Error publishing item <{item_id or 'undefined'}> to node <{target_node}>",
+                )
+
+        async def publish_many(
+            self,
+            target_jid: str,
+            target_node: str,
+            payloads: Iterable[Union[Element, str]],
+            max_in_flight: int = 10,
+            ifrom: str = None,
+            codec: Optional[str] = None,
+            retry: Optional[RetryPolicy] = None,
+        ) -> List[tuple[Optional[str], Optional[Exception]]]:
+            """
+            Publish several items to a node keeping up to `max_in_flight`
+            publish requests on the wire at the same time.
+
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str): Name of the PubSub node to publish to.
+                payloads (iterable of Element | str): Payloads to publish.
+                max_in_flight (int): Maximum number of unanswered publish requests.
+                codec (str or None): Name of the codec used to encode the payloads.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+
+            Return:
+                A list of tuples, in the format (item_id, error), in the same
+                order as `payloads`. `error` is None if the item was published, a
+                PubSubError if the service failed it, or the exception raised
+                encoding its payload.
+            """
+            if max_in_flight < 1:
+                raise ValueError("max_in_flight must be greater than 0")
+
+            payloads = list(payloads)
+            results = [None] * len(payloads)
+            pending = iter(enumerate(payloads))
+
+            async def _worker():
+                for index, payload in pending:
+                    try:
+                        published_id = await self._publish_item(
+                            target_jid,
+                            target_node,
+                            None,
+                            self._encode(target_jid, target_node, payload, codec),
+                            ifrom,
+                            retry,
+                        )
+                        results[index] = (published_id, None)
+                    except Exception as e:
+                        # Errors stay with their item, e.g. a payload the codec
+                        # cannot encode, instead of aborting the other ones
+                        logger.error(
+                            f"Error publishing item #{index} to node <{target_node}>: {e}"
+                        )
+                        results[index] = (None, e)
+
+            await asyncio.gather(
+                *(_worker() for _ in range(min(max_in_flight, len(payloads))))
+            )
+            return results
+
+        async def publish_nowait(
+            self,
+            target_jid: str,
+            target_node: str,
+            payload: Union[Element, str],
+            item_id: Optional[str] = None,
+            ifrom: str = None,
+            callback: Optional[
+                Callable[[Optional[str], Optional[Exception]], None]
+            ] = None,
+            codec: Optional[str] = None,
+        ) -> asyncio.Future:
+            """
+            Publish an item to a node without waiting for the server to acknowledge it.
+
+            The item is sent right away. This coroutine only waits when there are
+            already `max_unacked_publishes` publications pending of acknowledgement.
+            The item is not published again if it fails (unless the outbox is
+            enabled), but the timeout of the retry policy of the component applies.
+
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str): Name of the PubSub node to publish to.
+                payload (Element | str): Payload to publish.
+                item_id (str or None): Item ID to use for the item.
+                callback (callable or None): Called as callback(item_id, error) when
+                    the server answers. `error` is None if the item was published.
+                    Errors passed to the callback are not raised again if the
+                    returned future is never awaited.
+                codec (str or None): Name of the codec used to encode the payload.
+
+            Return:
+                A future that resolves to the item id, or raises a PubSubError.
+            """
+            await self._unacked_publishes.acquire()
+            ack = asyncio.get_running_loop().create_future()
+
+            limiter = self._rate_limiter
+            if limiter is not None:
+                bucket = limiter.bucket(self._bare(target_jid), target_node)
+                try:
+                    epoch = await bucket.acquire()
+                except BaseException:
+                    self._unacked_publishes.release()
+                    raise
+
+            metrics = self._metrics
+            if metrics is not None:
+                started = metrics.start("publish")
+            outbox = self._outbox
+            entry = None
+
+            def _on_response(response: asyncio.Future):
+                self._unacked_publishes.release()
+                if metrics is not None:
+                    metrics.finish(
+                        "publish",
+                        target_node,
+                        started,
+                        asyncio.CancelledError()
+                        if response.cancelled()
+                        else response.exception(),
+                    )
+                if response.cancelled():
+                    if entry is not None:
+                        outbox.release(entry)
+                    ack.cancel()
+                    return
+                error = response.exception()
+                if limiter is not None:
+                    if error is None:
+                        bucket.feedback(epoch, False)
+                    elif limiter.is_pushback(error):
+                        bucket.feedback(epoch, True)
+                if isinstance(error, (IqError, IqTimeout)):
+                    error = PubSubError.from_error("publish", target_node, error)
+                if entry is not None:
+                    self._settle(outbox, entry, error)
+                if error is not None:
+                    logger.error(
+                        f"Error publishing item <{item_id or 'undefined'}> to node <{target_node}>: {error}"
+                    )
+                    ack.set_exception(error)
+                else:
+                    ack.set_result(
+                        item_id or self._published_item_id(response.result())
+                    )
+                if callback is not None:
+                    if error is not None:
+                        ack.exception()  # Reported to the callback
+                    try:
+                        callback(None if error else ack.result(), error)
+                    except Exception:
+                        logger.exception(
+                            f"Error in publish callback for node <{target_node}>"
+                        )
+
+            try:
+                payload = self._encode(target_jid, target_node, payload, codec)
+                item_id = self._deliver_loopback(
+                    target_jid, target_node, item_id, payload
+                )
+                payload = self._compress(payload)
+                if outbox is not None:
+                    item_id = item_id or uuid.uuid4().hex
+                    entry = await outbox.add(
+                        self._bare(target_jid), target_node, item_id, payload
+                    )
+                response = self._publish_plugin(target_jid, target_node).publish(
+                    target_jid,
+                    target_node,
+                    item_id,
+                    payload,
+                    ifrom=ifrom,
+                    timeout=self._retry_policy.timeout,
+                )
+            except Exception as e:
+                self._unacked_publishes.release()
+                if entry is not None:
+                    outbox.release(entry)
+                if metrics is not None:
+                    metrics.finish("publish", target_node, started, e)
+                raise
+            response.add_done_callback(_on_response)
+            return ack
+
+        async def retract(
+            self,
+            target_jid: str,
+            target_node: str,
+            item_id: str,
+            notify=False,
+            retry: Optional[RetryPolicy] = None,
+        ):
+            """
+            Retract a previously published item from a node.
+
+            Args:
+                target_jid (str): Address of the PubSub service.
+                target_node (str): Name of the PubSub node to send a notify from.
+                item_id (str): The ID of the item to retract.
+                notify (bool): Flag indicating whether subscribers shall be notified about the retraction.
+                retry (RetryPolicy or None): Retry policy of this call, instead of the one
+                    of the component.
+            """
+            try:
+                return await self._call(
+                    "retract",
+                    target_node,
+                    self.pubsub.retract,
+                    target_jid,
+                    target_node,
+                    item_id,
+                    notify,
+                    retry=retry,
+                )
+            except PubSubError as e:
+                self._fail(
+                    e, f"Error retracting item <{item_id}> to node <{target_node}>"
+                )
+
+        async def _publish_item(
+            self,
+            target_jid: str,
+            target_node: str,
+            item_id: Optional[str],
+            payload: Element,
+            ifrom: Optional[str],
+            retry: Optional[RetryPolicy],
+        ) -> Optional[str]:
+            item_id = self._deliver_loopback(target_jid, target_node, item_id, payload)
+            payload = self._compress(payload)
+            outbox = self._outbox
+            entry = None
+            if outbox is not None:
+                item_id = item_id or uuid.uuid4().hex
+                entry = await outbox.add(
+                    self._bare(target_jid), target_node, item_id, payload
+                )
+            try:
+                res = await self._call(
+                    "publish",
+                    target_node,
+                    self._publisher(target_jid, target_node),
+                    target_jid,
+                    target_node,
+                    item_id,
+                    payload,
+                    ifrom=ifrom,
+                    retry=retry,
+                )
+            except BaseException as e:
+                if entry is not None:
+                    self._settle(outbox, entry, e)
+                raise
+            if entry is not None:
+                self._settle(outbox, entry, None)
+            return item_id or self._published_item_id(res)
+
+        @staticmethod
+        def _settle(outbox: Outbox, entry: int, error: Optional[BaseException]):
+            # Rejections that sending again will not fix are not replayed, while
+            # unreachable services (service-unavailable, ...) are
+            if error is None or (
+                isinstance(error, PubSubError)
+                and error.condition in PERMANENT_CONDITIONS
+            ):
+                outbox.remove(entry)
+            else:
+                outbox.release(entry)
+
+        async def _subscribe(
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            subscription_jid: Optional[str],
+            config,
+            retry: Optional[RetryPolicy],
+        ) -> Optional[str]:
+            sub = await self._call(
+                "subscribe",
+                target_node,
+                self.pubsub.subscribe,
+                target_jid,
+                target_node,
+                subscribee=subscription_jid,
+                options=config,
+                retry=retry,
+            )
+            subid = None
+            if sub["pubsub"] and sub["pubsub"]["subscription"]:
+                subid = sub["pubsub"]["subscription"]["subid"] or None
+            self._subscriptions.add(
+                self._bare(target_jid),
+                target_node,
+                subscription_jid or self.client.boundjid.bare,
+                subid,
+            )
+            self._sync_subscription(self._bare(target_jid), target_node)
+            if (
+                self._recovery is not None
+                and subscription_jid is None
+                and (self._bare(target_jid), target_node) not in self._last_seen
+            ):
+                await self._mark_latest_item(target_jid, target_node, retry)
+            return subid
+
+        async def _mark_latest_item(
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            retry: Optional[RetryPolicy],
+        ):
+            # An empty id marks a node that had no items, so that every item
+            # found there when recovering is a missed one.
+            try:
+                data: Iq = await self._call(
+                    "get_items",
+                    target_node,
+                    self.pubsub.get_items,
+                    target_jid,
+                    target_node,
+                    max_items=1,
+                    retry=retry,
+                )
+            except PubSubError as e:
+                logger.debug(f"Could not get the latest item of <{target_node}>: {e}")
+                return
+            ids = [item["id"] for item in data["pubsub"]["items"]]
+            self._last_seen.setdefault(
+                (self._bare(target_jid), target_node), ids[-1] if ids else ""
+            )
+
+        async def _unsubscribe(
+            self,
+            target_jid: str,
+            target_node: Optional[str],
+            subscription_jid: Optional[str],
+            subid: Optional[str],
+            retry: Optional[RetryPolicy],
+        ):
+            service = self._bare(target_jid)
+            jid = subscription_jid or self.client.boundjid.bare
+            if subid is None:
+                subid = self._subscriptions.subid(service, target_node, jid)
+            res = await self._call(
+                "unsubscribe",
+                target_node,
+                self.pubsub.unsubscribe,
+                target_jid,
+                target_node,
+                subscribee=subscription_jid,
+                subid=subid,
+                retry=retry,
+            )
+            self._subscriptions.remove(service, target_node, jid, subid)
+            self._sync_subscription(service, target_node)
+            return res
+
+        def _subscription_options(self, options: dict) -> Form:
+            form = self.client["xep_0004"].make_form(ftype="submit")
+            form.add_field(
+                var="FORM_TYPE",
+                ftype="hidden",
+                value="http://jabber.org/protocol/pubsub#subscribe_options",
+            )
+            for var, value in options.items():
+                form.add_field(var=var, value=value)
+            return form
+
+        async def _missing_subscriptions(
+            self, service: str, nodes: List[str], retry: Optional[RetryPolicy]
+        ) -> set[str]:
+            try:
+                res = await self._call(
+                    "get_subscriptions",
+                    None,
+                    self.pubsub.get_subscriptions,
+                    service,
+                    retry=retry,
+                )
+            except PubSubError as e:
+                # Subscribing again is better than missing every notification
+                logger.warning(f"Could not list the subscriptions at <{service}>: {e}")
+                return set(nodes)
+            active = {
+                sub["node"]
+                for sub in res["pubsub"]["subscriptions"]
+                if sub["subscription"] != "none"
+            }
+            return set(nodes) - active
+
+        async def _run_many(
+            self,
+            operation: str,
+            target_nodes: List[str],
+            request: Callable,
+            max_concurrency: int,
+        ) -> dict:
+            if max_concurrency < 1:
+                raise ValueError("max_concurrency must be greater than 0")
+            results = {}
+            pending = iter(target_nodes)
+
+            async def _worker():
+                for node in pending:
+                    try:
+                        results[node] = await request(node)
+                    except PubSubError as e:
+                        logger.error(f"Error in {operation} of node <{node}>: {e}")
+                        results[node] = e
+
+            await asyncio.gather(
+                *(_worker() for _ in range(min(max_concurrency, len(target_nodes))))
+            )
+            return {node: results[node] for node in target_nodes}
+
+        @staticmethod
+        def _bare(jid) -> Optional[str]:
+            return None if jid is None else JID(jid).bare
+
+        def _publish_plugin(
+            self, target_jid: str, target_node: Optional[str]
+        ) -> XEP_0060:
+            if not (self._stream_pool and self._stream_pool.clients):
+                return self.pubsub
+            return self._stream_pool.client(self._bare(target_jid), target_node)[
+                "xep_0060"
+            ]
+
+        def _publisher(self, target_jid: str, target_node: Optional[str]) -> Callable:
+            publish = self._publish_plugin(target_jid, target_node).publish
+            if self._rate_limiter is None:
+                return publish
+            return functools.partial(
+                self._rate_limiter.call, self._bare(target_jid), target_node, publish
+            )
+
+        def _sync_subscription(self, service: Optional[str], node: Optional[str]):
+            jid = self.client.boundjid.bare
+            subscribed = self._subscriptions.is_subscribed(service, node, jid)
+            if not subscribed:
+                self._last_seen.pop((service, node), None)
+                self._filters.pop((service, node), None)
+                # Filters of the node at any service go with its last subscription
+                if (None, node) in self._filters and all(
+                    key[1] != node for key in self._subscriptions.nodes(jid)
+                ):
+                    del self._filters[(None, node)]
+                if self._item_cache is not None:
+                    self._item_cache.forget(service, node)
+            if self._loopback is None:
+                return
+            if subscribed:
+                self._loopback.subscribe(service, node, self)
+            else:
+                self._loopback.unsubscribe(service, node, self)
+
+        def _deliver_loopback(
+            self,
+            target_jid: str,
+            target_node: str,
+            item_id: Optional[str],
+            payload: Element,
+        ) -> Optional[str]:
+            bus = self._loopback
+            service = self._bare(target_jid)
+            if bus is None or not bus.subscribers(service, target_node):
+                return item_id
+            if item_id is None:
+                item_id = uuid.uuid4().hex
+            bus.deliver(service, target_node, item_id, payload)
+            return item_id
+
+        def _deliver_local(
+            self, service: str, node: str, item_id: str, payload: Element
+        ):
+            if self._loopback_delivered is not None:
+                self._loopback_delivered.set((service, node, item_id), True)
+            self._publish_locally(service, node, item_id, payload)
+
+        def _publish_locally(
+            self, service: str, node: str, item_id: str, payload: Optional[Element]
+        ):
+            msg = self.client.Message(sto=self.client.boundjid, sfrom=service)
+            item = EventItem()
+            item["id"] = item_id
+            item["payload"] = payload
+            msg["pubsub_event"]["items"]["node"] = node
+            msg["pubsub_event"]["items"].append(item)
+            self._handle_published(msg)
+
+        def _is_loopback_echo(self, msg: Message) -> bool:
+            if self._loopback_delivered is None:
+                return False
+            key = (msg["from"].bare, msg["pubsub_event"]["items"]["node"])
+            ids = [item["id"] for item in msg["pubsub_event"]["items"].iterables]
+            return bool(ids) and all(
+                item_id and (*key, item_id) in self._loopback_delivered
+                for item_id in ids
+            )
+
+        def _fail(self, error: PubSubError, message: str):
+            if self.raise_errors:
+                raise error
+            logger.error(f"{message}: {error}")
+
+        async def _call(
+            self,
+            operation: str,
+            target_node: Optional[str],
+            request,
+            *args,
+            retry: Optional[RetryPolicy] = None,
+            **kwargs,
+        ):
+            policy = retry or self._retry_policy
+            if policy.timeout is not None:
+                kwargs["timeout"] = policy.timeout
+            attempt = 1
+            while True:
+                try:
+                    return await self._attempt(
+                        operation, target_node, request, *args, **kwargs
+                    )
+                except (IqError, IqTimeout) as e:
+                    if not policy.should_retry(e, attempt):
+                        raise PubSubError.from_error(
+                            operation, target_node, e, attempt
+                        ) from e
+                    logger.debug(f"Retrying {operation} on node <{target_node}>: {e}")
+                await asyncio.sleep(policy.delay(attempt))
+                attempt += 1
+
+        async def _attempt(
+            self, operation: str, target_node: Optional[str], request, *args, **kwargs
+        ):
+            metrics = self._metrics
+            if metrics is None:
+                return await request(*args, **kwargs)
+            started = metrics.start(operation)
+            try:
+                result = await request(*args, **kwargs)
+            except BaseException as e:
+                metrics.finish(operation, target_node, started, e)
+                raise
+            metrics.finish(operation, target_node, started)
+            return result
+
+        def _get_codec(self, name: str) -> Codec:
+            try:
+                return self._codecs[name]
+            except KeyError:
+                raise ValueError(f"Unknown payload codec <{name}>") from None
+
+        def _encode(
+            self,
+            target_jid: str,
+            target_node: str,
+            payload,
+            codec: Optional[str] = None,
+        ) -> Element:
+            if codec is None:
+                codec = self._node_codecs.get(
+                    (self._bare(target_jid), target_node)
+                ) or self._node_codecs.get((None, target_node))
+            if codec is None:
+                codec = "xml" if isinstance(payload, Element) else ""
+            return self._get_codec(codec).encode(payload)
+
+        def _compress(self, payload: Element) -> Element:
+            # Applied after the loopback delivery, so that local subscribers do
+            # not have to inflate the payload
+            if self._compression is not None:
+                compress_payload(payload, *self._compression)
+            return payload
+
+        def _wrap(self, callback: Callable, decode: bool) -> Callable:
+            return _DecodingCallback(self, callback) if decode else callback
+
+        @staticmethod
+        def _created_node(res: Iq, target_node: Optional[str]) -> Optional[str]:
+            if (
+                target_node
+                and res["pubsub"]
+                and res["pubsub"]["create"]
+                and res["pubsub"]["create"]["node"]
+            ):
+                return res["pubsub"]["create"]["node"]
+            return target_node
+
+        @staticmethod
+        def _published_item_id(res: Iq) -> Optional[str]:
+            if (
+                res["pubsub"]
+                and res["pubsub"]["publish"]
+                and res["pubsub"]["publish"]["item"]
+            ):
+                return res["pubsub"]["publish"]["item"]["id"]
+
+
+class _DecodingCallback:
+    """
+    Calls a callback with the decoded items of each notification.
+    It compares equal to the wrapped callback, so it can be removed with it.
+    """
+
+    def __init__(self, component, callback: Callable):
+        self.component = component
+        self.callback = callback
+
+    def __eq__(self, other):
+        if isinstance(other, _DecodingCallback):
+            return self.callback == other.callback
+        return self.callback == other
+
+    def __hash__(self):
+        return hash(self.callback)
+
+    def __call__(self, msg: Message):
+        results = [self.callback(item) for item in self.component.decode_items(msg)]
+        awaitables = [result for result in results if inspect.isawaitable(result)]
+        if awaitables:
+            return asyncio.gather(*awaitables)
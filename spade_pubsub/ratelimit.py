@@ -0,0 +1,153 @@
+import asyncio
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from slixmpp.exceptions import IqError
+
+PUSHBACK_CONDITIONS = ("policy-violation", "resource-constraint")
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose rate adapts to the answers of the service.
+
+    Each request takes a token. Tokens are refilled at `rate` per second, up to
+    `burst` (by default, one second worth of tokens at the current rate).
+    Every accepted request raises the rate so that it grows by about `increase`
+    requests per second each second (additive increase), and a rejected one
+    multiplies it by `decrease` (multiplicative decrease), always within
+    `min_rate` and `max_rate`.
+
+    Only requests sent after the last decrease can decrease the rate again, so
+    a burst of rejections of requests that were already in flight counts once.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[float] = None,
+        min_rate: float = 1.0,
+        max_rate: Optional[float] = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+    ):
+        if rate <= 0 or min_rate <= 0:
+            raise ValueError("rate and min_rate must be greater than 0")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.rate = self._clamp(rate)
+        self.burst = burst
+        self.tokens = self._capacity()
+        self.epoch = 0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> int:
+        """
+        Wait for a token and take it.
+
+        Return:
+            The epoch to report back with `feedback`.
+        """
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+            return self.epoch
+
+    def feedback(self, epoch: int, pushback: bool):
+        """
+        Adapt the rate to the answer of a request sent in `epoch`.
+        """
+        if not pushback:
+            self.rate = self._clamp(self.rate + self.increase / self.rate)
+        elif epoch == self.epoch:
+            self._refill()
+            self.rate = self._clamp(self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+            self.epoch += 1
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self._capacity(), self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def _capacity(self) -> float:
+        return self.burst if self.burst is not None else max(self.rate, 1.0)
+
+    def _clamp(self, rate: float) -> float:
+        rate = max(rate, self.min_rate)
+        if self.max_rate is not None:
+            rate = min(rate, self.max_rate)
+        return rate
+
+
+class RateLimiter:
+    """
+    Keeps an AdaptiveTokenBucket for each (service, node) pair.
+
+    Errors whose condition is in `pushback` are taken as a sign that the
+    service is overloaded and decrease the rate of the node.
+    """
+
+    def __init__(
+        self,
+        rate: float = 100.0,
+        burst: Optional[float] = None,
+        min_rate: float = 1.0,
+        max_rate: Optional[float] = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        pushback: Iterable[str] = PUSHBACK_CONDITIONS,
+    ):
+        self.settings = dict(
+            rate=rate,
+            burst=burst,
+            min_rate=min_rate,
+            max_rate=max_rate,
+            increase=increase,
+            decrease=decrease,
+        )
+        self.pushback = frozenset(pushback)
+        self._buckets: Dict[Tuple[str, Optional[str]], AdaptiveTokenBucket] = {}
+        AdaptiveTokenBucket(**self.settings)  # Validate the settings
+
+    def bucket(self, service: str, node: Optional[str]) -> AdaptiveTokenBucket:
+        bucket = self._buckets.get((service, node))
+        if bucket is None:
+            bucket = self._buckets[(service, node)] = AdaptiveTokenBucket(
+                **self.settings
+            )
+        return bucket
+
+    def rate(self, service: str, node: Optional[str]) -> float:
+        """
+        Return the current rate of a node, in requests per second.
+        """
+        return self.bucket(service, node).rate
+
+    def is_pushback(self, error: Optional[BaseException]) -> bool:
+        return isinstance(error, IqError) and error.condition in self.pushback
+
+    async def call(self, service: str, node: Optional[str], request, *args, **kwargs):
+        """
+        Await `request(*args, **kwargs)` once a token of the node is available.
+        """
+        bucket = self.bucket(service, node)
+        epoch = await bucket.acquire()
+        try:
+            result = await request(*args, **kwargs)
+        except IqError as e:
+            if self.is_pushback(e):
+                bucket.feedback(epoch, True)
+            raise
+        bucket.feedback(epoch, False)
+        return result
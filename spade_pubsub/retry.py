@@ -0,0 +1,133 @@
+import random
+from typing import Iterable, Optional
+
+from slixmpp.exceptions import IqError, IqTimeout
+
+RETRYABLE_CONDITIONS = (
+    "timeout",
+    "remote-server-timeout",
+    "resource-constraint",
+    "internal-server-error",
+    "service-unavailable",
+)
+
+
+class PubSubError(Exception):
+    """
+    A PubSub request that failed, after as many attempts as its retry policy allowed.
+
+    `condition` is the XMPP error condition returned by the service, or
+    ``"timeout"`` if no answer arrived in time. `etype` is the XMPP error type
+    (``"cancel"``, ``"wait"``, ...) and `text` the description sent with it.
+    The original slixmpp exception is kept as `__cause__`.
+    """
+
+    def __init__(
+        self,
+        operation: str,
+        target_node: Optional[str],
+        condition: str,
+        etype: Optional[str] = None,
+        text: str = "",
+        attempts: int = 1,
+    ):
+        self.operation = operation
+        self.target_node = target_node
+        self.condition = condition
+        self.etype = etype
+        self.text = text
+        self.attempts = attempts
+        super().__init__(str(self))
+
+    @classmethod
+    def from_error(
+        cls,
+        operation: str,
+        target_node: Optional[str],
+        error: Exception,
+        attempts: int = 1,
+    ) -> "PubSubError":
+        if isinstance(error, IqTimeout):
+            return cls(operation, target_node, "timeout", "wait", attempts=attempts)
+        return cls(
+            operation,
+            target_node,
+            error.condition or "undefined-condition",
+            error.etype,
+            error.text or "",
+            attempts,
+        )
+
+    @property
+    def timed_out(self) -> bool:
+        return self.condition == "timeout"
+
+    def __str__(self) -> str:
+        details = ": ".join(filter(None, (self.etype, self.condition, self.text)))
+        attempts = "attempt" if self.attempts == 1 else "attempts"
+        return (
+            f"{self.operation} on node <{self.target_node}> failed after "
+            f"{self.attempts} {attempts} ({details})"
+        )
+
+
+class RetryPolicy:
+    """
+    How a PubSub request is retried when it fails.
+
+    A request is attempted up to `max_attempts` times. Each attempt waits for
+    an answer at most `timeout` seconds (None uses the default of slixmpp).
+    Failed attempts are retried if their error condition is in `retryable`
+    (``"timeout"`` stands for an unanswered request) or, if `retry_wait` is
+    set, if the service sent an error of type ``"wait"``.
+
+    Before the n-th retry the policy waits ``backoff * multiplier ** (n - 1)``
+    seconds, at most `max_backoff`, reduced by a random fraction of up to
+    `jitter` so that clients failing at the same time do not retry together.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 1,
+        timeout: Optional[float] = None,
+        backoff: float = 0.1,
+        multiplier: float = 2.0,
+        max_backoff: float = 5.0,
+        jitter: float = 0.5,
+        retryable: Iterable[str] = RETRYABLE_CONDITIONS,
+        retry_wait: bool = True,
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be greater than 0")
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1")
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retryable = frozenset(retryable)
+        self.retry_wait = retry_wait
+
+    def should_retry(self, error: Exception, attempt: int) -> bool:
+        """
+        Return whether a request that failed with `error` in its `attempt`-th
+        attempt should be attempted again.
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if isinstance(error, IqTimeout):
+            return "timeout" in self.retryable
+        if isinstance(error, IqError):
+            return error.condition in self.retryable or (
+                self.retry_wait and error.etype == "wait"
+            )
+        return False
+
+    def delay(self, attempt: int) -> float:
+        """
+        Return the seconds to wait before retrying the `attempt`-th attempt.
+        """
+        delay = min(self.backoff * self.multiplier ** (attempt - 1), self.max_backoff)
+        return delay * (1 - self.jitter * random.random())
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Optional, Union
+
+from slixmpp.stanza import Message
+
+from .codecs import PubSubItem
+from .dispatch import Backlog
+
+STREAM_OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest", "keep_latest")
+
+
+class PubSubStream:
+    """
+    Asynchronous iterator over the items published to a node.
+
+    It yields the notification messages or, if `decode` is set, a PubSubItem
+    for each published item.
+
+    It is used as an asynchronous context manager, which subscribes to the
+    node on enter and unsubscribes on exit. Notifications wait in a queue of
+    `maxsize` messages until they are consumed; when it is full the
+    `overflow` policy applies:
+
+    * ``"block"``: the notification is held back in a Backlog of
+      `max_blocked` notifications (`maxsize` by default) until there is room
+      for it, and discarded if the backlog is full.
+    * ``"drop_oldest"``: the oldest queued notification is discarded.
+    * ``"drop_newest"``: the incoming notification is discarded.
+    * ``"keep_latest"``: only the latest notification is kept (`maxsize` is 1).
+    """
+
+    def __init__(
+        self,
+        component,
+        target_jid: str,
+        target_node: str,
+        maxsize: int = 100,
+        overflow: str = "block",
+        subscribe: bool = True,
+        decode: bool = False,
+        max_blocked: Optional[int] = None,
+    ):
+        if overflow not in STREAM_OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {STREAM_OVERFLOW_POLICIES}")
+        if overflow == "keep_latest":
+            maxsize = 1
+        if maxsize < 1:
+            raise ValueError("maxsize must be greater than 0")
+        self.component = component
+        self.target_jid = target_jid
+        self.target_node = target_node
+        self.overflow = overflow
+        self.max_blocked = maxsize if max_blocked is None else max_blocked
+        self.subscribe = subscribe
+        self.decode = decode
+        self.dropped = 0
+        self.subid: Optional[str] = None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._blocked = Backlog(self.max_blocked, f"the stream of node <{target_node}>")
+
+    async def __aenter__(self) -> "PubSubStream":
+        self.component.on_item_published(
+            self.target_node,
+            self._on_item,
+            target_jid=self.target_jid,
+            decode=self.decode,
+        )
+        if self.subscribe:
+            self.subid = await self.component.subscribe(
+                self.target_jid, self.target_node
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.component.off_item_published(
+            self.target_node, self._on_item, target_jid=self.target_jid
+        )
+        if self.subscribe:
+            await self.component.unsubscribe(
+                self.target_jid, self.target_node, subid=self.subid
+            )
+
+    def __aiter__(self) -> "PubSubStream":
+        return self
+
+    async def __anext__(self) -> Union[Message, PubSubItem]:
+        msg = await self._queue.get()
+        self._unblock()
+        return msg
+
+    def get_nowait(self) -> Union[Message, PubSubItem]:
+        """
+        Return a queued notification, or raise asyncio.QueueEmpty.
+        """
+        msg = self._queue.get_nowait()
+        self._unblock()
+        return msg
+
+    def qsize(self) -> int:
+        return self._queue.qsize() + len(self._blocked)
+
+    def _unblock(self):
+        if self._blocked:
+            self._queue.put_nowait(self._blocked.release())
+
+    def _on_item(self, msg: Union[Message, PubSubItem]):
+        if self.overflow == "block":
+            if not self._blocked and not self._queue.full():
+                self._queue.put_nowait(msg)
+            elif not self._blocked.hold(msg):
+                self.dropped += 1
+            return
+        if self._queue.full():
+            self.dropped += 1
+            if self.overflow == "drop_newest":
+                return
+            self._queue.get_nowait()
+        self._queue.put_nowait(msg)
@@ -0,0 +1,125 @@
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+NodeKey = Tuple[Optional[str], Optional[str]]
+
+
+class SubscriptionRegistry:
+    """
+    Local copy of the subscriptions of PubSub nodes, as (jid, subid) pairs.
+
+    Subscriptions are added and removed as the component subscribes and
+    unsubscribes and as the services notify subscription changes. The list of
+    subscribers of a node is only trusted once it has been `load`-ed from the
+    service, because until then it may miss the subscriptions of other jids.
+    Services do not notify the owner of every new subscriber (XEP-0060, 8.8),
+    so the subscribers of a load also become stale as time passes.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[NodeKey, Dict[Tuple[str, Optional[str]], None]] = {}
+        self._loaded: Dict[NodeKey, float] = {}
+
+    def load(
+        self,
+        service: Optional[str],
+        node: Optional[str],
+        subscriptions: Iterable[Tuple[str, Optional[str]]],
+    ):
+        """
+        Replace the subscriptions of a node with the ones sent by its service.
+        """
+        key = (service, node)
+        self._subscriptions[key] = {
+            (str(jid), subid or None): None for jid, subid in subscriptions
+        }
+        self._loaded[key] = time.monotonic()
+
+    def add(
+        self,
+        service: Optional[str],
+        node: Optional[str],
+        jid: str,
+        subid: Optional[str],
+    ):
+        records = self._subscriptions.setdefault((service, node), {})
+        jid = str(jid)
+        if subid:
+            records.pop((jid, None), None)
+        elif any(record[0] == jid for record in records):
+            return
+        records[(jid, subid or None)] = None
+
+    def remove(
+        self,
+        service: Optional[str],
+        node: Optional[str],
+        jid: str,
+        subid: Optional[str] = None,
+    ):
+        """
+        Remove the subscription `subid` of `jid`, or all of them if `subid` is None.
+        """
+        records = self._subscriptions.get((service, node))
+        if not records:
+            return
+        jid = str(jid)
+        for record in list(records):
+            if record[0] == jid and (subid is None or record[1] in (subid, None)):
+                del records[record]
+
+    def forget(self, service: Optional[str], node: Optional[str]):
+        """
+        Drop everything known about a node, e.g. because it was deleted.
+        """
+        self._subscriptions.pop((service, node), None)
+        self._loaded.pop((service, node), None)
+
+    def subscribers(
+        self,
+        service: Optional[str],
+        node: Optional[str],
+        max_age: Optional[float] = None,
+    ) -> Optional[List[str]]:
+        """
+        Return the jids subscribed to a node, or None if it has not been loaded
+        (or was loaded more than `max_age` seconds ago).
+        """
+        loaded = self._loaded.get((service, node))
+        if loaded is None:
+            return None
+        if max_age is not None and time.monotonic() - loaded > max_age:
+            return None
+        records = self._subscriptions.get((service, node), {})
+        return list(dict.fromkeys(jid for jid, _ in records))
+
+    def is_subscribed(
+        self, service: Optional[str], node: Optional[str], jid: str
+    ) -> bool:
+        jid = str(jid)
+        return any(
+            record[0] == jid for record in self._subscriptions.get((service, node), ())
+        )
+
+    def subid(
+        self, service: Optional[str], node: Optional[str], jid: str
+    ) -> Optional[str]:
+        """
+        Return the id of a subscription of `jid` to a node, if known.
+        """
+        jid = str(jid)
+        for record_jid, subid in self._subscriptions.get((service, node), ()):
+            if record_jid == jid and subid:
+                return subid
+        return None
+
+    def nodes(self, jid: str) -> List[NodeKey]:
+        """
+        Return the (service, node) pairs `jid` is known to be subscribed to.
+        """
+        jid = str(jid)
+        return [
+            key
+            for key, records in self._subscriptions.items()
+            if any(record[0] == jid for record in records)
+        ]
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.cache` module."""
+import time
+
+from spade_pubsub.cache import TTLCache
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert len(cache) == 2
+
+
+def test_cache_expires_entries():
+    cache = TTLCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_cache_discard_if():
+    cache = TTLCache()
+    cache.set(("pubsub.localhost", None), [])
+    cache.set(("pubsub.localhost", "collection"), [])
+    cache.set(("pubsub.other", None), [])
+    cache.discard_if(lambda key: key[0] == "pubsub.localhost")
+
+    assert len(cache) == 1
+    assert ("pubsub.other", None) in cache
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.codecs` module."""
+from xml.etree.ElementTree import Element
+
+import pytest
+
+from spade_pubsub import codecs
+from spade_pubsub.codecs import (
+    JSONCodec,
+    MsgPackCodec,
+    TextCodec,
+    XMLCodec,
+    compress_payload,
+    inflate_payload,
+)
+
+
+def test_text_codec_is_backwards_compatible():
+    payload = TextCodec().encode("Testing")
+
+    assert payload.get("codec") is None
+    assert payload.text == "Testing"
+    assert TextCodec().decode(payload) == "Testing"
+
+
+def test_json_codec_roundtrip():
+    value = {"temperature": 21.5, "tags": ["a", "b"]}
+    payload = JSONCodec().encode(value)
+
+    assert payload.get("codec") == "json"
+    assert JSONCodec().decode(payload) == value
+
+
+def test_xml_codec_roundtrip():
+    value = Element("reading", attrib={"kind": "temperature"})
+    payload = XMLCodec().encode(value)
+
+    assert payload.get("codec") == "xml"
+    assert XMLCodec().decode(payload) is value
+
+
+def test_compress_payload_above_threshold():
+    text = "Testing" * 100
+    payload = compress_payload(TextCodec().encode(text), threshold=100)
+
+    assert payload.get("encoding") == "deflate"
+    assert len(payload.text) < len(text)
+    assert inflate_payload(payload).text == text
+    assert payload.get("encoding") is None
+
+
+def test_compress_payload_below_threshold():
+    payload = compress_payload(TextCodec().encode("Testing"), threshold=100)
+
+    assert payload.get("encoding") is None
+    assert payload.text == "Testing"
+
+
+def test_msgpack_codec_roundtrip():
+    pytest.importorskip("msgpack")
+    value = {"temperature": 21.5, "tags": ["a", "b"]}
+    payload = MsgPackCodec().encode(value)
+
+    assert payload.get("codec") == "msgpack"
+    assert MsgPackCodec().decode(payload) == value
+
+
+def test_msgpack_codec_without_msgpack(monkeypatch):
+    monkeypatch.setattr(codecs, "msgpack", None)
+
+    assert "msgpack" in codecs.default_codecs()
+    with pytest.raises(ImportError, match=r"spade_pubsub\[msgpack\]"):
+        MsgPackCodec().encode({"value": 1})
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.dedup` module."""
+
+from slixmpp import ClientXMPP
+from slixmpp.plugins.xep_0060.stanza import EventItem
+
+from spade_pubsub import PubSubMixin
+from spade_pubsub.dedup import SeenItems
+
+
+def notification(component, kind, item_id):
+    msg = component.client.Message(sfrom="pubsub.localhost")
+    msg["pubsub_event"]["items"]["node"] = "node"
+    msg["pubsub_event"]["items"][kind]["id"] = item_id
+    return msg
+
+
+def test_seen_items_is_bounded():
+    seen = SeenItems(maxsize=2)
+
+    assert seen.add("pubsub.localhost", "node", "1")
+    assert seen.add("pubsub.localhost", "node", "2")
+    assert not seen.add("pubsub.localhost", "node", "1")
+    assert seen.add("pubsub.localhost", "other", "1")
+    # "2" was the least recently seen item
+    assert seen.add("pubsub.localhost", "node", "2")
+    assert seen.add("pubsub.localhost", "node", "")
+    assert seen.add("pubsub.localhost", "node", "")
+
+    assert len(seen) == 2
+    assert seen.dropped == 1
+
+
+def test_duplicate_notifications_are_dropped():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "password"))
+    seen = component.enable_deduplication()
+    metrics = component.enable_metrics()
+    received = []
+    component.set_on_item_published(received.append, decode=True)
+
+    for item_id in ("1", "2", "1", "2"):
+        component._on_publish(notification(component, "item", item_id))
+    component._on_retract(notification(component, "retract", "1"))
+    component._on_publish(notification(component, "item", "1"))
+
+    assert [item.id for item in received] == ["1", "2", "1"]
+    assert seen.dropped == 2
+    assert metrics.snapshot()["notifications"]["duplicate:node"]["count"] == 2
+
+
+def test_repeated_items_are_removed_from_notifications():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "password"))
+    seen = component.enable_deduplication()
+    received = []
+    component.set_on_item_published(
+        lambda msg: received.append(
+            [item["id"] for item in msg["pubsub_event"]["items"].iterables]
+        )
+    )
+
+    component._on_publish(notification(component, "item", "1"))
+    msg = notification(component, "item", "1")
+    msg["pubsub_event"]["items"].append(EventItem())
+    msg["pubsub_event"]["items"].iterables[1]["id"] = "2"
+    component._on_publish(msg)
+
+    assert received == [["1"], ["2"]]
+    assert seen.dropped == 1
+    # The notification itself is left untouched
+    assert len(msg["pubsub_event"]["items"].iterables) == 2
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.dispatch` module."""
+
+import asyncio
+
+import pytest
+from slixmpp import ClientXMPP
+
+from spade_pubsub import PubSubMixin
+from loguru import logger
+
+from spade_pubsub.dispatch import Backlog, CallbackExecutor, Conflator, EventRouter
+
+
+def test_router_matches_exact_and_wildcard_routes():
+    router = EventRouter()
+    router.add("pubsub.localhost", "node", "exact")
+    router.add(None, "node", "any_service")
+    router.add(None, None, "any")
+    router.add("pubsub.localhost", "other", "other")
+
+    assert router.match("pubsub.localhost", "node") == ["exact", "any_service", "any"]
+    assert router.match("pubsub.remote", "node") == ["any_service", "any"]
+
+
+def test_router_remove():
+    router = EventRouter()
+    router.add(None, "node", "first")
+    router.add(None, "node", "second")
+    router.remove(None, "node", "first")
+    assert router.match("pubsub.localhost", "node") == ["second"]
+
+    router.remove(None, "node")
+    assert router.match("pubsub.localhost", "node") == []
+    assert not router
+
+
+@pytest.mark.asyncio
+async def test_executor_keeps_order_per_node():
+    executor = CallbackExecutor(max_concurrency=2)
+    handled = []
+
+    async def slow(value):
+        await asyncio.sleep(0.01)
+        handled.append(value)
+
+    async def fast(value):
+        handled.append(value)
+
+    for i in range(3):
+        executor.submit(("pubsub.localhost", "slow"), [slow], f"slow{i}")
+    executor.submit(("pubsub.localhost", "fast"), [fast], "fast")
+    await asyncio.sleep(0.1)
+
+    assert handled[0] == "fast"
+    assert handled[1:] == ["slow0", "slow1", "slow2"]
+
+
+@pytest.mark.asyncio
+async def test_executor_drop_newest():
+    executor = CallbackExecutor(max_pending=1, overflow="drop_newest")
+    handled = []
+
+    executor.submit(("pubsub.localhost", "node"), [handled.append], 1)
+    executor.submit(("pubsub.localhost", "node"), [handled.append], 2)
+    await asyncio.sleep(0)
+
+    assert handled == [1]
+    assert executor.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_executor_block():
+    executor = CallbackExecutor(max_pending=1, overflow="block", max_blocked=2)
+    handled = []
+
+    for i in range(3):
+        executor.submit(("pubsub.localhost", "node"), [handled.append], i)
+    await asyncio.sleep(0.01)
+
+    assert handled == [0, 1, 2]
+    assert executor.dropped == 0
+
+
+def test_backlog_warns_when_it_starts_dropping():
+    warnings = []
+    handler = logger.add(warnings.append, level="WARNING")
+    backlog = Backlog(2, "test")
+    try:
+        assert [backlog.hold(i) for i in range(4)] == [True, True, False, False]
+        assert backlog.release() == 0
+        assert [backlog.hold(i) for i in range(4, 6)] == [True, False]
+    finally:
+        logger.remove(handler)
+
+    assert len(backlog) == 2
+    assert len(warnings) == 2
+
+
+@pytest.mark.asyncio
+async def test_executor_block_is_bounded():
+    executor = CallbackExecutor(max_pending=2, overflow="block", max_blocked=3)
+    handled = []
+
+    for i in range(10000):
+        executor.submit(("pubsub.localhost", f"node{i % 2}"), [handled.append], i)
+
+    assert (executor.pending, executor.blocked, executor.dropped) == (2, 3, 9995)
+    await asyncio.sleep(0.01)
+    assert sorted(handled) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_conflator_keeps_latest():
+    conflator = Conflator()
+    handled = []
+
+    async def slow(value):
+        await asyncio.sleep(0.01)
+        handled.append(value)
+
+    conflator.submit(("pubsub.localhost", "node"), [slow], 0)
+    await asyncio.sleep(0)
+    for i in range(1, 10):
+        conflator.submit(("pubsub.localhost", "node"), [slow], i)
+    conflator.submit(("pubsub.localhost", "other"), [slow], "other")
+    await asyncio.sleep(0.05)
+
+    assert sorted(handled, key=str) == [0, 9, "other"]
+    assert conflator.conflated == 8
+
+
+@pytest.mark.asyncio
+async def test_component_conflates_node():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "password"))
+    conflator = component.enable_conflation("sensor")
+    handled = []
+    component.set_on_item_published(handled.append, decode=True)
+
+    for node in ("sensor", "other"):
+        for i in range(100):
+            msg = component.client.Message(sfrom="pubsub.localhost")
+            msg["pubsub_event"]["items"]["node"] = node
+            msg["pubsub_event"]["items"]["item"]["id"] = str(i)
+            component._on_publish(msg)
+    await asyncio.sleep(0)
+
+    assert [item.id for item in handled if item.node == "sensor"] == ["99"]
+    assert len([item for item in handled if item.node == "other"]) == 100
+    assert conflator.conflated == 99
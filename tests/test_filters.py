@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.filters` module."""
+
+from xml.etree.ElementTree import Element, SubElement
+
+from slixmpp import ClientXMPP
+
+from spade_pubsub import PubSubMixin
+from spade_pubsub.filters import ItemFilter
+
+
+def test_item_filter_short_circuits():
+    decoded = []
+
+    def decode(payload):
+        decoded.append(payload)
+        return {
+            "sensor": {"kind": "temperature"},
+            "value": float(payload.find("reading").text),
+        }
+
+    def payload(tag, value):
+        element = Element("payload")
+        SubElement(element, tag).text = str(value)
+        return element
+
+    item_filter = ItemFilter(
+        xpath="reading",
+        fields={"sensor.kind": "temperature", "value": lambda value: value > 20},
+        predicate=lambda value: value["value"] < 30,
+    )
+
+    assert item_filter.matches(payload("reading", 25), decode)
+    assert not item_filter.matches(payload("reading", 15), decode)
+    assert not item_filter.matches(payload("reading", 35), decode)
+    assert not item_filter.matches(payload("other", 25), decode)
+    assert not item_filter.matches(None, decode)
+
+    assert len(decoded) == 3
+    assert item_filter.rejected == 4
+
+
+def test_component_filters_notifications():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "password"))
+    component.set_node_codec("node", "json")
+    component.set_node_filter("node", ItemFilter(fields={"room": "kitchen"}))
+    handled = []
+    component.set_on_item_published(handled.append, decode=True)
+
+    for item_id, room in (("1", "kitchen"), ("2", "garage"), ("3", "kitchen")):
+        msg = component.client.Message(sfrom="pubsub.localhost")
+        msg["pubsub_event"]["items"]["node"] = "node"
+        msg["pubsub_event"]["items"]["item"]["id"] = item_id
+        msg["pubsub_event"]["items"]["item"]["payload"] = component._encode(
+            "pubsub.localhost", "node", {"room": room}
+        )
+        component._on_publish(msg)
+
+    assert [item.id for item in handled] == ["1", "3"]
+
+    component.set_node_filter("node", None)
+    component._on_publish(msg)
+    assert len(handled) == 3
+
+
+def test_component_removes_filters_when_unsubscribed():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "password"))
+    jid = component.client.boundjid.bare
+    for service in ("pubsub.localhost", "pubsub.example.com"):
+        component._subscriptions.add(service, "node", jid, None)
+        component._sync_subscription(service, "node")
+    component.set_node_filter("node", ItemFilter(fields={"room": "kitchen"}))
+    component.set_node_filter(
+        "node", ItemFilter(), target_jid="pubsub.localhost"
+    )
+
+    component._subscriptions.remove("pubsub.localhost", "node", jid)
+    component._sync_subscription("pubsub.localhost", "node")
+    assert list(component._filters) == [(None, "node")]
+
+    component._subscriptions.remove("pubsub.example.com", "node", jid)
+    component._sync_subscription("pubsub.example.com", "node")
+    assert component._filters == {}
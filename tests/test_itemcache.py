@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.itemcache` module."""
+
+from xml.etree.ElementTree import Element
+
+from slixmpp import ClientXMPP
+from slixmpp.plugins.xep_0004.stanza.form import Form
+
+from spade_pubsub import PubSubMixin
+from spade_pubsub.itemcache import ItemCache
+
+
+def test_item_cache_ring_buffer():
+    cache = ItemCache(size=2)
+    assert cache.items("pubsub.localhost", "node") is None
+
+    version = cache.version("pubsub.localhost", "node")
+    cache.add("pubsub.localhost", "node", "1", "a")
+    # A notification arrived while the items were requested
+    cache.load("pubsub.localhost", "node", [], version)
+    assert cache.items("pubsub.localhost", "node") is None
+
+    cache.set_max_items("pubsub.localhost", "node", 5)
+    cache.load(
+        "pubsub.localhost",
+        "node",
+        [("1", "a")],
+        cache.version("pubsub.localhost", "node"),
+    )
+    cache.add("pubsub.localhost", "node", "2", "b")
+    assert cache.items("pubsub.localhost", "node") == [("1", "a"), ("2", "b")]
+
+    cache.remove("pubsub.localhost", "node", "1")
+    cache.add("pubsub.localhost", "node", "3", "c")
+    assert cache.items("pubsub.localhost", "node") == [("2", "b"), ("3", "c")]
+
+    # The oldest item is dropped, so the buffer no longer holds the whole node
+    cache.add("pubsub.localhost", "node", "4", "d")
+    assert cache.items("pubsub.localhost", "node") is None
+
+    cache.clear("pubsub.localhost", "node")
+    assert cache.items("pubsub.localhost", "node") == []
+
+
+async def test_get_items_served_from_notifications():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "password"))
+    component.enable_item_cache(size=10)
+    component._subscriptions.add("pubsub.localhost", "node", "agent@localhost", None)
+    component._item_cache.set_max_items("pubsub.localhost", "node", 10)
+    component._item_cache.clear("pubsub.localhost", "node")
+
+    msg = component.client.Message(sfrom="pubsub.localhost")
+    msg["pubsub_event"]["items"]["node"] = "node"
+    msg["pubsub_event"]["items"]["item"]["id"] = "item-1"
+    msg["pubsub_event"]["items"]["item"]["payload"] = component._encode(
+        "pubsub.localhost", "node", "hello"
+    )
+    component._on_publish(msg)
+
+    items = await component.get_items("pubsub.localhost", "node", decode=True)
+    assert items == [("item-1", "hello")]
+
+    msg = component.client.Message(sfrom="pubsub.localhost")
+    msg["pubsub_event"]["items"]["node"] = "node"
+    msg["pubsub_event"]["items"]["retract"]["id"] = "item-1"
+    component._on_retract(msg)
+
+    assert await component.get_items("pubsub.localhost", "node") == []
+
+
+def test_item_cache_keeps_max_items():
+    cache = ItemCache(size=10)
+    cache.set_max_items("pubsub.localhost", "node", 1)
+    cache.load("pubsub.localhost", "node", [], 0)
+    for item_id in "12345":
+        cache.add("pubsub.localhost", "node", item_id, item_id)
+    # The service only keeps the last item as well
+    assert cache.items("pubsub.localhost", "node") == [("5", "5")]
+
+
+def test_item_cache_unknown_max_items():
+    cache = ItemCache(size=10)
+    cache.load("pubsub.localhost", "node", [("1", "a"), ("2", "b")], 0)
+    cache.add("pubsub.localhost", "node", "2", "c")
+    assert cache.items("pubsub.localhost", "node") == [("1", "a"), ("2", "c")]
+
+    # The node may not keep more items than it held when it was loaded
+    cache.add("pubsub.localhost", "node", "3", "d")
+    assert cache.items("pubsub.localhost", "node") is None
+
+
+def test_item_cache_returns_copies():
+    cache = ItemCache(size=10)
+    payload = Element("entry")
+    cache.load("pubsub.localhost", "node", [("1", payload)], 0)
+    payload.text = "changed"
+
+    [(_, item)] = cache.items("pubsub.localhost", "node")
+    assert item.text is None
+    item.text = "changed"
+    assert cache.items("pubsub.localhost", "node")[0][1].text is None
+
+
+async def test_created_node_max_items():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "password"))
+    component.enable_item_cache(size=10)
+
+    async def call(operation, node, request, *args, **kwargs):
+        return component.client.Iq()
+
+    component._call = call
+    form = Form()
+    form.add_field(var="pubsub#max_items", value="2")
+    await component.create("pubsub.localhost", "node", config_form=form)
+
+    component._item_cache.clear("pubsub.localhost", "node")
+    for item_id in "123":
+        component._item_cache.add("pubsub.localhost", "node", item_id, item_id)
+    assert component._item_cache.items("pubsub.localhost", "node") == [
+        ("2", "2"),
+        ("3", "3"),
+    ]
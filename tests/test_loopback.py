@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.loopback` module."""
+
+from xml.etree.ElementTree import Element
+
+from slixmpp import ClientXMPP
+
+from spade_pubsub import PubSubMixin
+from spade_pubsub.loopback import LoopbackBus
+
+
+def make_component(jid):
+    return PubSubMixin.PubSubComponent(ClientXMPP(jid, "password"))
+
+
+def test_loopback_delivers_to_local_subscribers():
+    bus = LoopbackBus()
+    publisher = make_component("publisher@localhost")
+    subscriber = make_component("subscriber@localhost")
+    other = make_component("other@localhost")
+    subscriber._subscriptions.add(
+        "pubsub.localhost", "node", "subscriber@localhost", None
+    )
+    for component in (publisher, subscriber, other):
+        component.enable_loopback(bus)
+
+    received = []
+    subscriber.set_on_item_published(received.append, decode=True)
+    other.set_on_item_published(received.append, decode=True)
+
+    payload = publisher._encode("pubsub.localhost", "node", "hello")
+    item_id = publisher._deliver_loopback("pubsub.localhost", "node", None, payload)
+
+    assert item_id is not None
+    assert len(received) == 1
+    assert received[0].id == item_id
+    assert received[0].payload == "hello"
+
+    subscriber.disable_loopback()
+    assert bus.subscribers("pubsub.localhost", "node") == []
+    assert (
+        publisher._deliver_loopback("pubsub.localhost", "node", None, payload) is None
+    )
+
+
+def test_loopback_ignores_notification_from_service():
+    bus = LoopbackBus()
+    component = make_component("subscriber@localhost")
+    component.enable_loopback(bus)
+    bus.subscribe("pubsub.localhost", "node", component)
+    received = []
+    component.set_on_item_published(received.append)
+
+    bus.deliver("pubsub.localhost", "node", "item-1", Element("data"))
+
+    def notification(item_id):
+        msg = component.client.Message(sfrom="pubsub.localhost")
+        msg["pubsub_event"]["items"]["node"] = "node"
+        msg["pubsub_event"]["items"]["item"]["id"] = item_id
+        return msg
+
+    component._on_publish(notification("item-1"))
+    component._on_publish(notification("item-2"))
+
+    assert [msg["pubsub_event"]["items"]["item"]["id"] for msg in received] == [
+        "item-1",
+        "item-2",
+    ]
+
+
+async def test_loopback_delivers_uncompressed_payloads():
+    bus = LoopbackBus()
+    publisher = make_component("publisher@localhost")
+    subscriber = make_component("subscriber@localhost")
+    subscriber._subscriptions.add(
+        "pubsub.localhost", "node", "subscriber@localhost", None
+    )
+    for component in (publisher, subscriber):
+        component.enable_loopback(bus)
+    publisher.enable_compression(threshold=1)
+    sent = []
+
+    async def call(operation, node, request, *args, **kwargs):
+        sent.append(args[3])
+        return publisher.client.Iq()
+
+    publisher._call = call
+    received = []
+    subscriber.set_on_item_published(received.append)
+
+    await publisher.publish("pubsub.localhost", "node", "hello " * 100)
+
+    local = received[0]["pubsub_event"]["items"]["item"]["payload"]
+    assert local.get("encoding") is None
+    assert local.text == "hello " * 100
+    assert sent[0].get("encoding") == "deflate"
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.metrics` module."""
+
+from spade_pubsub.metrics import Histogram, Metrics
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.05, 0.05, 0.5):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 4
+    assert snapshot["buckets"] == {0.01: 1, 0.1: 3, 1.0: 4, float("inf"): 4}
+    assert histogram.quantile(0.5) == 0.1
+
+
+def test_metrics_counts_outcomes_and_in_flight():
+    metrics = Metrics()
+    started = metrics.start("publish")
+    assert metrics.snapshot()["in_flight"] == {"publish": 1}
+
+    metrics.finish("publish", "node", started)
+    metrics.finish("publish", "node", metrics.start("publish"), TimeoutError())
+    metrics.notification("publish", "node")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["in_flight"] == {"publish": 0}
+    assert snapshot["outcomes"] == {"publish:ok": 1, "publish:TimeoutError": 1}
+    assert snapshot["latency"]["publish"]["count"] == 2
+    assert snapshot["node_latency"]["publish:node"]["count"] == 2
+    assert snapshot["notifications"]["publish:node"]["count"] == 1
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.outbox` module."""
+
+import asyncio
+from xml.etree.ElementTree import Element
+
+from slixmpp import ClientXMPP
+from slixmpp.exceptions import IqError, IqTimeout
+
+from spade_pubsub import PubSubMixin
+from spade_pubsub.outbox import Outbox
+from spade_pubsub.retry import PubSubError
+
+
+def make_error(condition, etype):
+    iq = ClientXMPP("agent@localhost", "pw").Iq(stype="error")
+    iq["error"]["condition"] = condition
+    iq["error"]["type"] = etype
+    return PubSubError.from_error("publish", "node", IqError(iq))
+
+
+def make_payload(text):
+    payload = Element("payload")
+    payload.text = text
+    return payload
+
+
+async def test_outbox_group_commit(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path, commit_interval=0.05)
+
+    entries = await asyncio.gather(
+        *(
+            outbox.add("pubsub.localhost", "node", f"item{i}", make_payload(str(i)))
+            for i in range(10)
+        )
+    )
+    assert outbox.commits == 1
+    assert await outbox.take() == []
+
+    outbox.remove(entries[0])
+    outbox.release(entries[1])
+    outbox.close()
+
+    outbox = Outbox(path)
+    taken = await outbox.take()
+    assert [item_id for _, _, _, item_id, _ in taken] == [
+        f"item{i}" for i in range(1, 10)
+    ]
+    assert taken[0][4].text == "1"
+    assert await outbox.take() == []
+    outbox.close()
+
+
+async def test_outbox_keeps_unacknowledged_items(tmp_path):
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "pw"))
+    outbox = component.enable_outbox(str(tmp_path / "outbox.db"))
+    answers = [
+        PubSubError.from_error("publish", "node", IqTimeout(None)),
+        make_error("service-unavailable", "cancel"),
+        None,
+        make_error("forbidden", "auth"),
+    ]
+    published = []
+
+    async def call(operation, node, request, *args, **kwargs):
+        answer = answers.pop(0)
+        if answer is not None:
+            raise answer
+        published.append(args[2])
+
+    component._call = call
+
+    assert await component.publish("pubsub.localhost", "node", "payload") is None
+    assert len(outbox) == 1 and not outbox.in_flight
+
+    assert await component.replay_outbox() == 0
+    assert len(outbox) == 1 and not outbox.in_flight
+
+    assert await component.replay_outbox() == 1
+    assert len(published) == 1
+    assert len(outbox) == 0
+
+    assert await component.publish("pubsub.localhost", "node", "payload") is None
+    assert len(outbox) == 0 and not outbox.in_flight
+    component.disable_outbox()
+    assert outbox.closed
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.pool` module."""
+
+import asyncio
+
+import pytest
+from slixmpp import ClientXMPP
+
+from spade_pubsub.pool import StreamPool
+
+
+def make_pool(node_affinity):
+    client = ClientXMPP("agent@localhost/main", "password")
+    pool = StreamPool(client, size=3, node_affinity=node_affinity)
+    pool._watch([pool._create(index) for index in range(3)])
+    return pool
+
+
+def test_stream_pool_resources():
+    pool = make_pool(node_affinity=True)
+
+    assert [str(client.boundjid) for client in pool.clients] == [
+        "agent@localhost/main-pubsub-0",
+        "agent@localhost/main-pubsub-1",
+        "agent@localhost/main-pubsub-2",
+    ]
+    with pytest.raises(ValueError):
+        StreamPool(pool.clients[0], size=0)
+
+
+def test_stream_pool_node_affinity():
+    pool = make_pool(node_affinity=True)
+    streams = {pool.client("pubsub.localhost", f"node{i}") for i in range(30)}
+
+    assert len(streams) == 3
+    assert all(
+        pool.client("pubsub.localhost", "node")
+        is pool.client("pubsub.localhost", "node")
+        for _ in range(5)
+    )
+
+    pool = make_pool(node_affinity=False)
+    assert [pool.client("pubsub.localhost", "node") for _ in range(4)] == [
+        pool.clients[0],
+        pool.clients[1],
+        pool.clients[2],
+        pool.clients[0],
+    ]
+
+
+async def test_stream_pool_skips_disconnected_streams():
+    pool = make_pool(node_affinity=True)
+    streams = list(pool.clients)
+    assert all(client.plugin["xep_0199"].keepalive for client in streams)
+
+    streams[1].event("disconnected")
+    assert pool.clients == [streams[0], streams[2]]
+    assert {pool.client("pubsub.localhost", f"node{i}") for i in range(30)} == {
+        streams[0],
+        streams[2],
+    }
+
+    streams[1].event("session_start")
+    assert pool.clients == streams
+    await pool.stop()
+
+
+async def test_stream_pool_reconnects_streams():
+    pool = make_pool(node_affinity=True)
+    pool.reconnect_delay = 0.01
+    streams = list(pool.clients)
+    connects = []
+    streams[1].connect = lambda *address: connects.append(address)
+
+    streams[1].event("disconnected")
+    streams[1].event("disconnected")
+    await asyncio.sleep(0.05)
+    assert connects == [()]
+    # The session did not start, so the next attempt waits longer
+    streams[1].event("disconnected")
+    assert pool._attempts[streams[1]] == 2
+
+    await pool.stop()
+    await asyncio.sleep(0.05)
+    assert connects == [()]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.pubsub` module."""
+
+import pytest
+from slixmpp import ClientXMPP
+
+from spade_pubsub import PubSubMixin
+
+
+def make_component(listed, latest):
+    client = ClientXMPP("agent@localhost", "pw")
+    client.register_plugin("xep_0060")
+    component = PubSubMixin.PubSubComponent(client)
+    requested = []
+
+    async def call(operation, node, request, *args, **kwargs):
+        requested.append((operation, kwargs.get("max_items")))
+        if operation == "get_nodes":
+            return {"disco_items": {"items": [("", None, i) for i in listed]}}
+        return {"pubsub": {"items": [{"id": i, "payload": None} for i in latest]}}
+
+    async def get_items_by_ids(target_jid, target_node, item_ids, retry=None):
+        return [(item_id, None) for item_id in item_ids]
+
+    component._call = call
+    component.get_items_by_ids = get_items_by_ids
+    return component, requested
+
+
+@pytest.mark.parametrize(
+    "listed",
+    [["a", "b", "c", "d"], ["d", "c", "b", "a"]],
+)
+async def test_get_items_since_follows_listing_order(listed):
+    component, _ = make_component(listed, latest=["d"])
+
+    items = await component.get_items_since("pubsub.localhost", "node", "b")
+
+    assert [item_id for item_id, _ in items] == ["c", "d"]
+
+
+async def test_get_items_since_without_known_order():
+    component, requested = make_component(["b", "d", "a", "c"], latest=["c", "d"])
+
+    await component.get_items_since("pubsub.localhost", "node", "b", max_items=2)
+    assert ("get_items", 2) in requested
+
+    requested.clear()
+    await component.get_items_since("pubsub.localhost", "node", None, max_items=2)
+    assert requested == [("get_items", 2)]
+
+
+async def test_publish_many_keeps_encoding_errors_per_item():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "pw"))
+    published = []
+
+    async def call(operation, node, request, *args, **kwargs):
+        published.append(args[3])
+        return component.client.Iq()
+
+    component._call = call
+    payloads = [{"value": 1}, {"value": {2}}, {"value": 3}]
+
+    results = await component.publish_many(
+        "pubsub.localhost", "node", payloads, max_in_flight=1, codec="json"
+    )
+
+    assert [error is None for _, error in results] == [True, False, True]
+    assert isinstance(results[1][1], TypeError)
+    assert len(published) == 2
+
+
+async def test_recovery_skips_nodes_without_latest_item():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "pw"))
+    component.enable_recovery(max_items=10)
+    received = []
+    component.set_on_item_published(received.append, decode=True)
+    latest = {"empty": [], "full": ["z"], "unknown": ["y"]}
+
+    async def call(operation, node, request, *args, **kwargs):
+        if operation == "subscribe":
+            return component.client.Iq()
+        if operation == "get_subscriptions":
+            return {"pubsub": {"subscriptions": []}}
+        if operation == "get_nodes":
+            return {"disco_items": {"items": [("", None, "z")]}}
+        items = ["a", "b"] if kwargs.get("max_items") == 10 else latest[node]
+        return {"pubsub": {"items": [{"id": i, "payload": None} for i in items]}}
+
+    component._call = call
+    await component.subscribe("pubsub.localhost", "empty")
+    await component.subscribe("pubsub.localhost", "full")
+    component._subscriptions.add("pubsub.localhost", "unknown", "agent@localhost", None)
+    assert component._last_seen == {
+        ("pubsub.localhost", "empty"): "",
+        ("pubsub.localhost", "full"): "z",
+    }
+
+    results = await component.recover(max_items=10)
+
+    # The node that was empty gets its items, the unknown one only its subscription
+    assert results[("pubsub.localhost", "empty")] == 2
+    assert results[("pubsub.localhost", "full")] == 0
+    assert results[("pubsub.localhost", "unknown")] == 0
+    assert component._last_seen[("pubsub.localhost", "empty")] == "b"
+    # Subscribing again records the latest item for the next reconnection
+    assert component._last_seen[("pubsub.localhost", "unknown")] == "y"
+    assert [item.id for item in received] == ["a", "b"]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.ratelimit` module."""
+
+import time
+
+import pytest
+from slixmpp import ClientXMPP
+from slixmpp.exceptions import IqError
+
+from spade_pubsub.ratelimit import AdaptiveTokenBucket, RateLimiter
+
+
+def make_iq_error(condition):
+    iq = ClientXMPP("agent@localhost", "password").Iq(stype="error")
+    iq["error"]["condition"] = condition
+    return IqError(iq)
+
+
+async def test_token_bucket_limits_rate():
+    bucket = AdaptiveTokenBucket(rate=50, burst=1)
+
+    start = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+
+    assert time.monotonic() - start >= 0.09
+
+
+def test_token_bucket_additive_increase_multiplicative_decrease():
+    bucket = AdaptiveTokenBucket(rate=10, min_rate=2, max_rate=11, increase=5)
+
+    epoch = bucket.epoch
+    bucket.feedback(epoch, False)
+    assert bucket.rate == pytest.approx(10.5)
+
+    bucket.feedback(epoch, True)
+    assert bucket.rate == pytest.approx(5.25)
+    # Rejections of requests sent before the decrease do not count again
+    bucket.feedback(epoch, True)
+    assert bucket.rate == pytest.approx(5.25)
+
+    for _ in range(3):
+        bucket.feedback(bucket.epoch, True)
+    assert bucket.rate == 2
+
+    for _ in range(100):
+        bucket.feedback(bucket.epoch, False)
+    assert bucket.rate == 11
+
+
+async def test_rate_limiter_adapts_per_node():
+    limiter = RateLimiter(rate=100)
+
+    async def reject():
+        raise make_iq_error("resource-constraint")
+
+    async def accept():
+        return "ok"
+
+    with pytest.raises(IqError):
+        await limiter.call("pubsub.localhost", "a", reject)
+    assert await limiter.call("pubsub.localhost", "b", accept) == "ok"
+
+    assert limiter.rate("pubsub.localhost", "a") == 50
+    assert limiter.rate("pubsub.localhost", "b") > 100
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.retry` module."""
+
+import asyncio
+
+import pytest
+from slixmpp import ClientXMPP
+from slixmpp.exceptions import IqError, IqTimeout
+
+from spade_pubsub import PubSubMixin
+from spade_pubsub.retry import PubSubError, RetryPolicy
+
+
+def make_iq_error(condition, etype):
+    client = ClientXMPP("agent@localhost", "password")
+    iq = client.Iq(stype="error")
+    iq["error"]["condition"] = condition
+    iq["error"]["type"] = etype
+    return IqError(iq)
+
+
+def test_retry_policy_retryable_errors():
+    policy = RetryPolicy(max_attempts=3)
+
+    assert policy.should_retry(IqTimeout(None), 1)
+    assert policy.should_retry(make_iq_error("resource-constraint", "wait"), 2)
+    assert policy.should_retry(make_iq_error("policy-violation", "wait"), 1)
+    assert not policy.should_retry(make_iq_error("item-not-found", "cancel"), 1)
+    assert not policy.should_retry(IqTimeout(None), 3)
+
+
+def test_retry_policy_backoff():
+    policy = RetryPolicy(backoff=0.1, multiplier=2, max_backoff=0.3, jitter=0.5)
+
+    assert 0.05 <= policy.delay(1) <= 0.1
+    assert 0.1 <= policy.delay(2) <= 0.2
+    assert 0.15 <= policy.delay(5) <= 0.3
+
+
+async def test_call_retries_until_success():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "pw"))
+    calls = []
+
+    async def request(timeout=None):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise IqTimeout(None)
+        return "ok"
+
+    policy = RetryPolicy(max_attempts=3, timeout=2, backoff=0)
+    assert await component._call("publish", "node", request, retry=policy) == "ok"
+    assert calls == [2, 2, 2]
+
+
+async def test_call_raises_structured_error():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "pw"))
+    component.set_retry_policy(RetryPolicy(max_attempts=5, backoff=0))
+    attempts = 0
+
+    async def request():
+        nonlocal attempts
+        attempts += 1
+        raise make_iq_error("item-not-found", "cancel")
+
+    with pytest.raises(PubSubError) as info:
+        await component._call("delete", "node", request)
+
+    assert attempts == 1
+    assert info.value.condition == "item-not-found"
+    assert info.value.operation == "delete"
+    assert isinstance(info.value.__cause__, IqError)
+
+
+async def test_publish_nowait_reports_errors_to_callback():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "pw"))
+    responses = []
+
+    class Plugin:
+        def publish(self, *args, **kwargs):
+            responses.append(asyncio.get_running_loop().create_future())
+            return responses[-1]
+
+    component._publish_plugin = lambda target_jid, target_node: Plugin()
+    errors = []
+
+    def callback(item_id, error):
+        errors.append(error)
+        raise RuntimeError("callback failed")
+
+    ack = await component.publish_nowait(
+        "pubsub.localhost", "node", "payload", callback=callback
+    )
+    responses[0].set_exception(make_iq_error("forbidden", "auth"))
+    await asyncio.sleep(0)
+
+    assert isinstance(errors[0], PubSubError)
+    assert errors[0].condition == "forbidden"
+    assert ack.done() and ack._log_traceback is False
+
+
+async def test_publish_nowait_counts_cancelled_publishes():
+    component = PubSubMixin.PubSubComponent(ClientXMPP("agent@localhost", "pw"))
+    metrics = component.enable_metrics()
+    responses = []
+
+    class Plugin:
+        def publish(self, *args, **kwargs):
+            responses.append(asyncio.get_running_loop().create_future())
+            return responses[-1]
+
+    component._publish_plugin = lambda target_jid, target_node: Plugin()
+
+    ack = await component.publish_nowait("pubsub.localhost", "node", "payload")
+    responses[0].cancel()
+    await asyncio.sleep(0)
+
+    assert ack.cancelled()
+    assert metrics.snapshot()["outcomes"] == {"publish:cancelled": 1}
@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 
 """Tests for `spade_pubsub` package."""
+import asyncio
 import pytest
 
 from uuid import uuid4
 from spade.behaviour import OneShotBehaviour
+from spade_pubsub.loopback import LoopbackBus
+from spade_pubsub.outbox import Outbox
+from spade_pubsub.retry import PubSubError, RetryPolicy
 from .factories import PubSubAgentFactory
 
 
@@ -267,3 +271,701 @@ async def test_retract_item(server):
 
     await agent.stop()
     assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_publish_many(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    agent.client.register_plugin('xep_0004')
+    config_form = agent.client.plugin["xep_0004"].make_form(ftype="submit")
+    config_form.addField('pubsub#persist_items', value=True)
+
+    payloads = [f"{TEST_PAYLOAD}{i}" for i in range(5)]
+
+    class PublishManyBehaviour(OneShotBehaviour):
+        async def run(self):
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE, config_form)
+            results = await self.agent.pubsub.publish_many(
+                PUBSUB_JID, TEST_NODE, payloads, max_in_flight=3
+            )
+            items = await self.agent.pubsub.get_items(PUBSUB_JID, TEST_NODE)
+            await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=(results, items))
+
+    behaviour = PublishManyBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    results, items = behaviour.exit_code
+    assert len(results) == len(payloads)
+    assert all(error is None for _, error in results)
+    assert sorted(i[1].text for i in items) == payloads
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_publish_nowait(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    confirmed = []
+
+    class PublishNowaitBehaviour(OneShotBehaviour):
+        async def run(self):
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE)
+            ack = await self.agent.pubsub.publish_nowait(
+                PUBSUB_JID,
+                TEST_NODE,
+                TEST_PAYLOAD,
+                ITEM_ID,
+                callback=lambda item_id, error: confirmed.append((item_id, error)),
+            )
+            item_id = await ack
+            await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=item_id)
+
+    behaviour = PublishNowaitBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    assert behaviour.exit_code == ITEM_ID
+    assert confirmed == [(ITEM_ID, None)]
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_node_cache(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    agent.pubsub.enable_node_cache(ttl=60)
+
+    class NodeCacheBehaviour(OneShotBehaviour):
+        async def run(self):
+            before = await self.agent.pubsub.get_nodes(PUBSUB_JID)
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE)
+            created = await self.agent.pubsub.get_nodes(PUBSUB_JID)
+            cached = await self.agent.pubsub.get_nodes(PUBSUB_JID)
+            await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+            after = await self.agent.pubsub.get_nodes(PUBSUB_JID)
+            self.kill(exit_code=(before, created, cached, after))
+
+    behaviour = NodeCacheBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    before, created, cached, after = behaviour.exit_code
+    assert len(before) == 0
+    assert [node["node"] for node in created] == [TEST_NODE]
+    assert cached == created
+    assert len(after) == 0
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_ensure_node(server):
+    owner = PubSubAgentFactory(jid=AGENT_JID)
+    agent = PubSubAgentFactory(jid=AGENT_JID_2)
+
+    await owner.start(auto_register=True)
+    await agent.start(auto_register=True)
+    assert owner.is_alive() is True
+    assert agent.is_alive() is True
+
+    class EnsureNodeBehaviour(OneShotBehaviour):
+        async def run(self):
+            await owner.pubsub.create(PUBSUB_JID, TEST_NODE)
+            first = await self.agent.pubsub.ensure_node(PUBSUB_JID, TEST_NODE)
+            second = await self.agent.pubsub.ensure_node(PUBSUB_JID, TEST_NODE)
+            nodes = await self.agent.pubsub.get_nodes(PUBSUB_JID)
+            await owner.pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=(first, second, nodes))
+
+    behaviour = EnsureNodeBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    first, second, nodes = behaviour.exit_code
+    assert first == TEST_NODE
+    assert second == TEST_NODE
+    assert [node["node"] for node in nodes] == [TEST_NODE]
+
+    await agent.stop()
+    await owner.stop()
+    assert agent.is_alive() is False
+    assert owner.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_iter_items(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    agent.client.register_plugin('xep_0004')
+    config_form = agent.client.plugin["xep_0004"].make_form(ftype="submit")
+    config_form.addField('pubsub#persist_items', value=True)
+
+    payloads = [f"{TEST_PAYLOAD}{i}" for i in range(5)]
+
+    class IterItemsBehaviour(OneShotBehaviour):
+        async def run(self):
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE, config_form)
+            await self.agent.pubsub.publish_many(PUBSUB_JID, TEST_NODE, payloads)
+            items = [
+                item
+                async for item in self.agent.pubsub.iter_items(
+                    PUBSUB_JID, TEST_NODE, page_size=2
+                )
+            ]
+            limited = [
+                item
+                async for item in self.agent.pubsub.iter_items(
+                    PUBSUB_JID, TEST_NODE, page_size=2, max_items=3
+                )
+            ]
+            await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=(items, limited))
+
+    behaviour = IterItemsBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    items, limited = behaviour.exit_code
+    assert sorted(i[1].text for i in items) == payloads
+    assert len(limited) == 3
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_get_items_since(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    agent.client.register_plugin('xep_0004')
+    config_form = agent.client.plugin["xep_0004"].make_form(ftype="submit")
+    config_form.addField('pubsub#persist_items', value=True)
+
+    item_ids = [f"{ITEM_ID}-{i}" for i in range(3)]
+
+    class DeltaBehaviour(OneShotBehaviour):
+        async def run(self):
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE, config_form)
+            for item_id in item_ids:
+                await self.agent.pubsub.publish(
+                    PUBSUB_JID, TEST_NODE, TEST_PAYLOAD, item_id
+                )
+            since = await self.agent.pubsub.get_items_since(
+                PUBSUB_JID, TEST_NODE, item_ids[0]
+            )
+            by_ids = await self.agent.pubsub.get_items_by_ids(
+                PUBSUB_JID, TEST_NODE, [item_ids[0], item_ids[2]]
+            )
+            await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=(since, by_ids))
+
+    behaviour = DeltaBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    since, by_ids = behaviour.exit_code
+    assert [i[0] for i in since] == item_ids[1:]
+    assert sorted(i[0] for i in by_ids) == sorted([item_ids[0], item_ids[2]])
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_on_item_published_per_node(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    other_node = f"{TEST_NODE}_other"
+    received = asyncio.Queue()
+    agent.pubsub.on_item_published(
+        TEST_NODE,
+        lambda msg: received.put_nowait(msg["pubsub_event"]["items"]["node"]),
+    )
+
+    class RoutedPublishBehaviour(OneShotBehaviour):
+        async def run(self):
+            for node in (other_node, TEST_NODE):
+                await self.agent.pubsub.create(PUBSUB_JID, node)
+                await self.agent.pubsub.subscribe(PUBSUB_JID, node)
+            await self.agent.pubsub.publish(PUBSUB_JID, other_node, TEST_PAYLOAD)
+            await self.agent.pubsub.publish(PUBSUB_JID, TEST_NODE, TEST_PAYLOAD)
+            node = await asyncio.wait_for(received.get(), timeout=5)
+            for node_name in (other_node, TEST_NODE):
+                await self.agent.pubsub.delete(PUBSUB_JID, node_name)
+            self.kill(exit_code=node)
+
+    behaviour = RoutedPublishBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    assert behaviour.exit_code == TEST_NODE
+    assert received.empty()
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_publish_with_codec(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    agent.client.register_plugin('xep_0004')
+    config_form = agent.client.plugin["xep_0004"].make_form(ftype="submit")
+    config_form.addField('pubsub#persist_items', value=True)
+
+    value = {"payload": TEST_PAYLOAD, "values": [1, 2, 3]}
+
+    class CodecBehaviour(OneShotBehaviour):
+        async def run(self):
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE, config_form)
+            await self.agent.pubsub.publish(
+                PUBSUB_JID, TEST_NODE, value, ITEM_ID, codec="json"
+            )
+            items = await self.agent.pubsub.get_items(
+                PUBSUB_JID, TEST_NODE, decode=True
+            )
+            await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=items)
+
+    behaviour = CodecBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    assert behaviour.exit_code == [(ITEM_ID, value)]
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_publish_compressed(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    agent.client.register_plugin('xep_0004')
+    config_form = agent.client.plugin["xep_0004"].make_form(ftype="submit")
+    config_form.addField('pubsub#persist_items', value=True)
+
+    agent.pubsub.enable_compression(threshold=100)
+    large_payload = TEST_PAYLOAD * 1000
+
+    class CompressedBehaviour(OneShotBehaviour):
+        async def run(self):
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE, config_form)
+            await self.agent.pubsub.publish(PUBSUB_JID, TEST_NODE, large_payload)
+            items = await self.agent.pubsub.get_items(PUBSUB_JID, TEST_NODE)
+            await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=items)
+
+    behaviour = CompressedBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    assert len(behaviour.exit_code) == 1
+    assert behaviour.exit_code[0][1].text == large_payload
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_metrics(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    exported = []
+    metrics = agent.pubsub.enable_metrics(exporter=exported.append)
+
+    class MetricsBehaviour(OneShotBehaviour):
+        async def run(self):
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE)
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE)
+            await self.agent.pubsub.publish(PUBSUB_JID, TEST_NODE, TEST_PAYLOAD)
+            await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+
+    behaviour = MetricsBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    metrics.export()
+    snapshot = exported[-1]
+    assert snapshot["outcomes"]["create:ok"] == 1
+    assert snapshot["outcomes"]["create:conflict"] == 1
+    assert snapshot["outcomes"]["publish:ok"] == 1
+    assert snapshot["latency"]["delete"]["count"] == 1
+    assert sum(snapshot["in_flight"].values()) == 0
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_raise_errors(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    agent.pubsub.raise_errors = True
+    agent.pubsub.set_retry_policy(RetryPolicy(max_attempts=3, timeout=5, backoff=0))
+
+    class RaiseErrorsBehaviour(OneShotBehaviour):
+        async def run(self):
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE)
+            try:
+                await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE)
+            except PubSubError as e:
+                self.kill(exit_code=(e.condition, e.attempts))
+            finally:
+                await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+
+    behaviour = RaiseErrorsBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    assert behaviour.exit_code == ("conflict", 1)
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_publish_rate_limit(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    limiter = agent.pubsub.enable_rate_limit(rate=20, burst=1)
+
+    class RateLimitBehaviour(OneShotBehaviour):
+        async def run(self):
+            await self.agent.pubsub.create(PUBSUB_JID, TEST_NODE)
+            start = asyncio.get_running_loop().time()
+            results = await self.agent.pubsub.publish_many(
+                PUBSUB_JID, TEST_NODE, [TEST_PAYLOAD] * 5, max_in_flight=5
+            )
+            elapsed = asyncio.get_running_loop().time() - start
+            await self.agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=(results, elapsed))
+
+    behaviour = RateLimitBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    results, elapsed = behaviour.exit_code
+    assert all(error is None for _, error in results)
+    assert elapsed >= 0.19
+    assert limiter.rate(PUBSUB_JID, TEST_NODE) > 20
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_subscribe_many(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    metrics = agent.pubsub.enable_metrics()
+    nodes = [f"{TEST_NODE}{i}" for i in range(5)]
+
+    class SubscribeManyBehaviour(OneShotBehaviour):
+        async def run(self):
+            for node in nodes:
+                await self.agent.pubsub.create(PUBSUB_JID, node)
+            # pyjabber asks for a subid, which it does not return, to unsubscribe
+            # users with more than one subscription, so unsubscribe_many is
+            # checked with a single node.
+            await self.agent.pubsub.subscribe_many(PUBSUB_JID, nodes[:1])
+            unsubscribed = await self.agent.pubsub.unsubscribe_many(
+                PUBSUB_JID, nodes[:1]
+            )
+            subscribed = await self.agent.pubsub.subscribe_many(
+                PUBSUB_JID, nodes, max_concurrency=3
+            )
+            again = await self.agent.pubsub.subscribe_many(PUBSUB_JID, nodes)
+            for node in nodes:
+                await self.agent.pubsub.delete(PUBSUB_JID, node)
+            self.kill(exit_code=(unsubscribed, subscribed, again))
+
+    behaviour = SubscribeManyBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    unsubscribed, subscribed, again = behaviour.exit_code
+    assert unsubscribed == {nodes[0]: None}
+    assert list(subscribed) == nodes
+    assert not any(isinstance(r, Exception) for r in subscribed.values())
+    assert again == subscribed
+    assert metrics.snapshot()["outcomes"]["subscribe:ok"] == len(nodes) + 1
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_node_subscriptions_registry(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    metrics = agent.pubsub.enable_metrics()
+    agent.pubsub.enable_subscription_cache(ttl=None)
+
+    class RegistryBehaviour(OneShotBehaviour):
+        async def run(self):
+            pubsub = self.agent.pubsub
+            await pubsub.create(PUBSUB_JID, TEST_NODE)
+            first = await pubsub.get_node_subscriptions(PUBSUB_JID, TEST_NODE)
+            await pubsub.subscribe(PUBSUB_JID, TEST_NODE)
+            cached = await pubsub.get_node_subscriptions(PUBSUB_JID, TEST_NODE)
+            refreshed = await pubsub.get_node_subscriptions(
+                PUBSUB_JID, TEST_NODE, refresh=True
+            )
+            await pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=(first, cached, refreshed))
+
+    behaviour = RegistryBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    first, cached, refreshed = behaviour.exit_code
+    assert first == []
+    assert cached == [AGENT_JID]
+    assert refreshed == [AGENT_JID]
+    assert metrics.snapshot()["outcomes"]["get_subscriptions:ok"] == 2
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_loopback_delivery(server):
+    publisher = PubSubAgentFactory(jid=AGENT_JID)
+    subscriber = PubSubAgentFactory(jid=AGENT_JID_2)
+
+    await publisher.start(auto_register=True)
+    await subscriber.start(auto_register=True)
+
+    bus = LoopbackBus()
+    publisher.pubsub.enable_loopback(bus)
+    subscriber.pubsub.enable_loopback(bus)
+    received = []
+    subscriber.pubsub.set_on_item_published(received.append, decode=True)
+
+    class LoopbackBehaviour(OneShotBehaviour):
+        async def run(self):
+            pubsub = self.agent.pubsub
+            await pubsub.create(PUBSUB_JID, TEST_NODE)
+            await subscriber.pubsub.subscribe(PUBSUB_JID, TEST_NODE)
+            item_id = await pubsub.publish(PUBSUB_JID, TEST_NODE, TEST_PAYLOAD)
+            # Wait for the notification of the service as well
+            for _ in range(40):
+                if len(received) > 1:
+                    break
+                await asyncio.sleep(0.05)
+            delivered = list(received)
+            items = await pubsub.get_items(PUBSUB_JID, TEST_NODE)
+            await pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=(item_id, delivered, items))
+
+    behaviour = LoopbackBehaviour()
+    publisher.add_behaviour(behaviour)
+    await behaviour.join()
+
+    item_id, delivered, items = behaviour.exit_code
+    assert item_id is not None
+    # The local delivery comes first. Known limitation: pyjabber leaves the item
+    # ids out of its notifications, so its copy of the item cannot be told apart
+    # from the local one and the subscriber receives the item twice.
+    assert len(delivered) == 2
+    assert (delivered[0].id, delivered[0].payload) == (item_id, TEST_PAYLOAD)
+    assert not delivered[1].id
+    assert [stored_id for stored_id, _ in items] == [item_id]
+
+    await publisher.stop()
+    await subscriber.stop()
+
+
+@pytest.mark.asyncio
+async def test_item_cache(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    agent.pubsub.enable_item_cache(size=10)
+    metrics = agent.pubsub.enable_metrics()
+
+    class ItemCacheBehaviour(OneShotBehaviour):
+        async def run(self):
+            pubsub = self.agent.pubsub
+            await pubsub.create(PUBSUB_JID, TEST_NODE)
+            await pubsub.publish(PUBSUB_JID, TEST_NODE, TEST_PAYLOAD, ITEM_ID)
+            await pubsub.subscribe(PUBSUB_JID, TEST_NODE)
+            fetched = await pubsub.get_items(PUBSUB_JID, TEST_NODE, decode=True)
+            cached = await pubsub.get_items(PUBSUB_JID, TEST_NODE, decode=True)
+            await pubsub.get_items(PUBSUB_JID, TEST_NODE, refresh=True)
+            await pubsub.purge(PUBSUB_JID, TEST_NODE)
+            purged = await pubsub.get_items(PUBSUB_JID, TEST_NODE)
+            await pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=(fetched, cached, purged))
+
+    behaviour = ItemCacheBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    fetched, cached, purged = behaviour.exit_code
+    assert fetched == [(ITEM_ID, TEST_PAYLOAD)]
+    assert cached == fetched
+    assert purged == []
+    assert metrics.snapshot()["outcomes"]["get_items:ok"] == 2
+
+    await agent.stop()
+    assert agent.is_alive() is False
+
+
+@pytest.mark.asyncio
+async def test_recovery_after_reconnect(server):
+    # pyjabber only lets the owner of a node publish and retrieve its items, so
+    # the items are published from another connection of the same account.
+    subscriber = PubSubAgentFactory(jid=AGENT_JID)
+    publisher = PubSubAgentFactory(jid=AGENT_JID)
+
+    await subscriber.start(auto_register=True)
+    await publisher.start(auto_register=True)
+
+    subscriber.pubsub.enable_recovery(max_items=10)
+    received = []
+    subscriber.pubsub.set_on_item_published(received.append, decode=True)
+
+    await subscriber.pubsub.create(PUBSUB_JID, TEST_NODE)
+    await subscriber.pubsub.subscribe(PUBSUB_JID, TEST_NODE)
+    await subscriber.stop()
+
+    await publisher.pubsub.publish(PUBSUB_JID, TEST_NODE, TEST_PAYLOAD, ITEM_ID)
+
+    await subscriber.start(auto_register=True)
+    # The recovery runs in the background after connecting
+    for _ in range(50):
+        if ITEM_ID in [item.id for item in received]:
+            break
+        await asyncio.sleep(0.1)
+    subscriptions = await subscriber.pubsub.get_node_subscriptions(
+        PUBSUB_JID, TEST_NODE, refresh=True
+    )
+    await subscriber.pubsub.delete(PUBSUB_JID, TEST_NODE)
+
+    assert (ITEM_ID, TEST_PAYLOAD) in [(item.id, item.payload) for item in received]
+    assert subscriptions == [AGENT_JID]
+
+    await subscriber.stop()
+    await publisher.stop()
+
+
+@pytest.mark.asyncio
+async def test_stream_pool(server):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    pool = await agent.pubsub.enable_stream_pool(size=2, node_affinity=False)
+
+    class StreamPoolBehaviour(OneShotBehaviour):
+        async def run(self):
+            pubsub = self.agent.pubsub
+            await pubsub.create(PUBSUB_JID, TEST_NODE)
+            results = await pubsub.publish_many(
+                PUBSUB_JID, TEST_NODE, [f"{TEST_PAYLOAD}{i}" for i in range(10)]
+            )
+            items = await pubsub.get_items(PUBSUB_JID, TEST_NODE, decode=True)
+            await pubsub.delete(PUBSUB_JID, TEST_NODE)
+            self.kill(exit_code=(results, items))
+
+    behaviour = StreamPoolBehaviour()
+    agent.add_behaviour(behaviour)
+    await behaviour.join()
+
+    results, items = behaviour.exit_code
+    assert all(error is None for _, error in results)
+    assert sorted(payload for _, payload in items) == sorted(
+        f"{TEST_PAYLOAD}{i}" for i in range(10)
+    )
+    assert len(pool.clients) == 2
+
+    await agent.stop()
+    assert agent.is_alive() is False
+    await asyncio.sleep(0.1)
+    assert pool.clients == []
+
+
+@pytest.mark.asyncio
+async def test_outbox_replay(server, tmp_path):
+    agent = PubSubAgentFactory(jid=AGENT_JID)
+
+    await agent.start(auto_register=True)
+    assert agent.is_alive() is True
+
+    path = str(tmp_path / "outbox.db")
+    await agent.pubsub.create(PUBSUB_JID, TEST_NODE)
+    outbox = Outbox(path)
+    entry = await outbox.add(
+        PUBSUB_JID, TEST_NODE, ITEM_ID, agent.pubsub._encode(None, None, TEST_PAYLOAD)
+    )
+    outbox.release(entry)
+    outbox.close()
+
+    # Enabling an outbox with pending items replays them in the background
+    outbox = agent.pubsub.enable_outbox(path)
+    for _ in range(50):
+        if len(outbox) == 0:
+            break
+        await asyncio.sleep(0.1)
+    items = await agent.pubsub.get_items(PUBSUB_JID, TEST_NODE, decode=True)
+    await agent.pubsub.delete(PUBSUB_JID, TEST_NODE)
+
+    assert len(outbox) == 0
+    assert (ITEM_ID, TEST_PAYLOAD) in items
+
+    agent.pubsub.disable_outbox()
+    await agent.stop()
+    assert agent.is_alive() is False
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.stream` module."""
+import pytest
+
+from spade_pubsub.dispatch import EventRouter, run_callback
+from spade_pubsub.stream import PubSubStream
+
+PUBSUB_JID = "pubsub.localhost"
+TEST_NODE = "Test_Node"
+
+
+class FakeComponent:
+    def __init__(self):
+        self.routes = EventRouter()
+        self.subscribed = set()
+
+    def on_item_published(self, target_node, callback, target_jid=None, decode=False):
+        self.routes.add(target_jid, target_node, callback)
+
+    def off_item_published(self, target_node, callback=None, target_jid=None):
+        self.routes.remove(target_jid, target_node, callback)
+
+    async def subscribe(self, target_jid, target_node):
+        self.subscribed.add((target_jid, target_node))
+        return "subid"
+
+    async def unsubscribe(self, target_jid, target_node, subid=None):
+        self.subscribed.discard((target_jid, target_node))
+
+    def publish(self, item):
+        for callback in self.routes.match(PUBSUB_JID, TEST_NODE):
+            run_callback(callback, item)
+
+
+@pytest.mark.asyncio
+async def test_stream_subscribes_and_yields_items():
+    component = FakeComponent()
+
+    async with PubSubStream(component, PUBSUB_JID, TEST_NODE) as stream:
+        assert component.subscribed == {(PUBSUB_JID, TEST_NODE)}
+        component.publish("first")
+        component.publish("second")
+        assert await stream.__anext__() == "first"
+        assert await stream.__anext__() == "second"
+
+    assert component.subscribed == set()
+    assert not component.routes
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "overflow, expected",
+    [
+        ("block", ["first", "second", "third"]),
+        ("drop_oldest", ["second", "third"]),
+        ("drop_newest", ["first", "second"]),
+        ("keep_latest", ["third"]),
+    ],
+)
+async def test_stream_overflow(overflow, expected):
+    component = FakeComponent()
+
+    async with PubSubStream(
+        component, PUBSUB_JID, TEST_NODE, maxsize=2, overflow=overflow
+    ) as stream:
+        for item in ("first", "second", "third"):
+            component.publish(item)
+        received = [stream.get_nowait() for _ in range(stream.qsize())]
+
+    assert received == expected
+    assert stream.dropped == 3 - len(expected)
+
+
+@pytest.mark.asyncio
+async def test_stream_block_is_bounded():
+    component = FakeComponent()
+
+    async with PubSubStream(
+        component, PUBSUB_JID, TEST_NODE, maxsize=2, max_blocked=1
+    ) as stream:
+        for item in range(10000):
+            component.publish(item)
+        assert stream.qsize() == 3
+        received = [await stream.__anext__() for _ in range(3)]
+
+    assert received == [0, 1, 2]
+    assert stream.dropped == 9997
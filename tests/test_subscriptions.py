@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""Tests for `spade_pubsub.subscriptions` module."""
+
+import time
+
+from spade_pubsub.subscriptions import SubscriptionRegistry
+
+SERVICE = "pubsub.localhost"
+
+
+def test_subscribers_are_unknown_until_loaded():
+    registry = SubscriptionRegistry()
+    registry.add(SERVICE, "node", "a@localhost", "1")
+
+    assert registry.subscribers(SERVICE, "node") is None
+    assert registry.is_subscribed(SERVICE, "node", "a@localhost")
+    assert registry.subid(SERVICE, "node", "a@localhost") == "1"
+
+    registry.load(SERVICE, "node", [("a@localhost", "1"), ("b@localhost", None)])
+    assert registry.subscribers(SERVICE, "node") == ["a@localhost", "b@localhost"]
+
+
+def test_add_and_remove_subscriptions():
+    registry = SubscriptionRegistry()
+    registry.load(SERVICE, "node", [])
+
+    registry.add(SERVICE, "node", "a@localhost", None)
+    registry.add(SERVICE, "node", "a@localhost", "1")
+    registry.add(SERVICE, "node", "a@localhost", "2")
+    registry.add(SERVICE, "node", "b@localhost", None)
+    assert registry.subscribers(SERVICE, "node") == ["a@localhost", "b@localhost"]
+
+    registry.remove(SERVICE, "node", "a@localhost", "1")
+    assert registry.subid(SERVICE, "node", "a@localhost") == "2"
+
+    registry.remove(SERVICE, "node", "a@localhost")
+    assert registry.subscribers(SERVICE, "node") == ["b@localhost"]
+
+    registry.forget(SERVICE, "node")
+    assert registry.subscribers(SERVICE, "node") is None
+    assert not registry.is_subscribed(SERVICE, "node", "b@localhost")
+
+
+def test_subscribers_expire_after_max_age():
+    registry = SubscriptionRegistry()
+    registry.load(SERVICE, "node", [("a@localhost", None)])
+
+    assert registry.subscribers(SERVICE, "node", max_age=10) == ["a@localhost"]
+    time.sleep(0.02)
+    assert registry.subscribers(SERVICE, "node", max_age=0.01) is None
+    assert registry.subscribers(SERVICE, "node") == ["a@localhost"]